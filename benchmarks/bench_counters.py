@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Throughput of a single shared Int hit with += from many threads
+
+Each configuration runs once on its own and once journaled with
+fsync='always', where every commit is expensive and holds the lock while
+it syncs. Combining only pays off in the second case: it turns a queue of
+waiting updates into one commit.
+
+usage: python benchmarks/bench_counters.py [increments] [threads]
+"""
+
+import sys
+import tempfile
+import threading
+import time
+
+import tram
+
+
+def run(combining, increments, threads, journaled=False):
+    counter = tram.Int()
+    counter.set_combining(combining)
+    def worker():
+        nonlocal counter
+        for _ in range(increments):
+            counter += 1
+    thread_list = [threading.Thread(target=worker) for _ in range(threads)]
+    with tempfile.TemporaryDirectory() as path:
+        journal = tram.Journal(path, {'counter' : counter}, fsync='always')
+        if journaled:
+            journal.open()
+        start = time.perf_counter()
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        journal.close()
+    assert counter == increments * threads
+    return increments * threads / elapsed
+
+
+def main():
+    increments = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print("{:>10} {:>10} {:>12}".format('journaled', 'combining', 'ops/s'))
+    for journaled in (False, True):
+        count = max(increments // 20, 1) if journaled else increments
+        for combining in (False, True):
+            print("{:>10} {:>10} {:>12.0f}".format(
+                str(journaled), str(combining), run(combining, count, threads, journaled)
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Ledger transfers from a plain thread pool versus tram.Executor
+
+usage: python benchmarks/bench_executor.py [transfers] [accounts] [workers]
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import random
+import sys
+import time
+
+import tram
+
+
+def batch(transfers, accounts):
+    ledger = [tram.Int(1000) for _ in range(accounts)]
+    return ledger, [
+        (tram.transfer_value, ) + tuple(random.sample(ledger, 2)) + (1, )
+        for _ in range(transfers)
+    ]
+
+
+def pool(transfers, accounts, workers):
+    ledger, tasks = batch(transfers, accounts)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        for future in [executor.submit(*task) for task in tasks]:
+            future.result()
+    return transfers / (time.perf_counter() - start)
+
+
+def grouped(transfers, accounts, workers):
+    ledger, tasks = batch(transfers, accounts)
+    with tram.Executor(workers) as executor:
+        result = executor.submit(tasks)
+        result.wait()
+    return result.throughput
+
+
+def main():
+    transfers = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    accounts = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    print("{:>10} {:>12}".format('runner', 'transfers/s'))
+    for name, run in (('pool', pool), ('executor', grouped)):
+        print("{:>10} {:>12.0f}".format(name, run(transfers, accounts, workers)))
+
+
+if __name__ == '__main__':
+    main()
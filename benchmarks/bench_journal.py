@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Commit latency of Int.__iadd__ under each Journal fsync policy
+
+usage: python benchmarks/bench_journal.py [commits] [threads]
+"""
+
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import tram
+from tram.journal import FSYNC_POLICIES
+
+
+def run(fsync, commits, threads):
+    counters = [tram.Int() for _ in range(threads)]
+    latencies = []
+    def worker(counter):
+        local = []
+        for _ in range(commits):
+            start = time.perf_counter()
+            counter += 1
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+    def timed():
+        start = time.perf_counter()
+        thread_list = [threading.Thread(target=worker, args=(c, )) for c in counters]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        return time.perf_counter() - start
+    if fsync is None:
+        return latencies, timed()
+    with tempfile.TemporaryDirectory() as path:
+        objects = {str(n) : counter for n, counter in enumerate(counters)}
+        with tram.Journal(path, objects, fsync=fsync):
+            elapsed = timed()
+    return latencies, elapsed
+
+
+def main():
+    commits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    print("{:>10} {:>12} {:>12} {:>12}".format('fsync', 'median us', 'p99 us', 'commits/s'))
+    for fsync in (None, ) + FSYNC_POLICIES:
+        latencies, elapsed = run(fsync, commits, threads)
+        latencies.sort()
+        print("{:>10} {:>12.1f} {:>12.1f} {:>12.0f}".format(
+            fsync or 'none',
+            statistics.median(latencies) * 1e6,
+            latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+            len(latencies) / elapsed,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Transaction throughput from 1 to N threads
+
+Run once with a regular build and once with a free-threaded build (or
+with PYTHON_GIL=0 and PYTHON_GIL=1 on a free-threaded build) to compare.
+
+usage: python benchmarks/bench_scaling.py [operations per thread] [max threads]
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+import tram
+
+
+def private_counters(threads, operations):
+    """Every thread increments its own Int: no conflicts"""
+    counters = [tram.Int() for _ in range(threads)]
+    def worker(counter):
+        for _ in range(operations):
+            counter += 1
+    return [(worker, (counter, )) for counter in counters]
+
+
+def transfers(threads, operations, accounts=64):
+    """Threads move value between random pairs of shared accounts"""
+    balances = [tram.Int(1000) for _ in range(accounts)]
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(operations):
+            left, right = rng.sample(balances, 2)
+            tram.transfer_value(left, right, 1)
+    return [(worker, (seed, )) for seed in range(threads)]
+
+
+def run(workload, threads, operations):
+    thread_list = [
+        threading.Thread(target=target, args=args)
+        for target, args in workload(threads, operations)
+    ]
+    start = time.perf_counter()
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    return threads * operations / (time.perf_counter() - start)
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+    print("python {} ({})".format(sys.version.split()[0], 'GIL' if gil else 'free-threaded'))
+    print("{:>8} {:>18} {:>18}".format('threads', 'private ops/s', 'transfers ops/s'))
+    threads = 1
+    while threads <= limit:
+        print("{:>8} {:>18.0f} {:>18.0f}".format(
+            threads,
+            run(private_counters, threads, operations),
+            run(transfers, threads, operations),
+        ))
+        threads *= 2
+
+
+if __name__ == '__main__':
+    main()
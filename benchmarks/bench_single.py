@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Per-operation latency of single-object updates: full TL2 vs Action.apply
+
+usage: python benchmarks/bench_single.py [operations]
+"""
+
+import sys
+import time
+
+import tram
+from tram.decorators import atomic
+from tram.objects import Action
+
+
+def increment(data):
+    return data + 1
+
+
+def append(data):
+    return data + [0]
+
+
+def transaction(instance, function):
+    do = Action()
+    do.transaction(instance, write_action=atomic(function))
+
+
+def measure(path, instance, function, operations):
+    start = time.perf_counter()
+    for _ in range(operations):
+        path(instance, function)
+    return (time.perf_counter() - start) / operations
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print("{:>12} {:>16} {:>16}".format('operation', 'transaction us', 'apply us'))
+    for name, factory, function in (('Int += 1', tram.Int, increment), ('List.append', tram.List, append)):
+        timings = [
+            measure(path, factory(), function, operations) * 1e6
+            for path in (transaction, Action.apply)
+        ]
+        print("{:>12} {:>16.2f} {:>16.2f}".format(name, *timings))
+
+
+if __name__ == '__main__':
+    main()
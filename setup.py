@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(name='tram',
       description='Threadsafe objects with transactional memory',
       packages=['tram'],
+      python_requires='>=3.7',
      )
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import pickle
+import threading
+import time
+
+import pytest
+
+import tram as m
+from tram.objects import Action
+
+
+def test_cache_mapping():
+    cache = m.Cache(maxsize=4)
+    cache['a'] = 1
+    cache.set('b', 2)
+    assert cache['a'] == 1
+    assert cache.get('b') == 2
+    assert cache.get('c', 3) == 3
+    assert 'a' in cache and 'c' not in cache
+    assert len(cache) == 2
+    assert sorted(cache) == ['a', 'b']
+    del cache['a']
+    with pytest.raises(KeyError):
+        cache['a']
+    with pytest.raises(KeyError):
+        del cache['a']
+    cache.clear()
+    assert len(cache) == 0
+    with pytest.raises(ValueError):
+        m.Cache(policy='fifo')
+
+
+def test_cache_lru():
+    cache = m.Cache(maxsize=3)
+    for key in 'abc':
+        cache[key] = key
+    cache['a']
+    cache['d'] = 'd'
+    assert sorted(cache) == ['a', 'c', 'd']
+    assert cache.evictions == 1
+
+
+def test_cache_lfu():
+    cache = m.Cache(maxsize=3, policy='lfu')
+    for key in 'abc':
+        cache[key] = key
+    for _ in range(3):
+        cache['a'], cache['b']
+    cache['c']
+    cache['d'] = 'd'
+    assert sorted(cache) == ['a', 'b', 'd']
+
+
+def test_cache_ttl():
+    cache = m.Cache(maxsize=3, policy='ttl', ttl=60)
+    cache.set('a', 1, ttl=0)
+    assert 'a' not in cache
+    assert cache.get('a') is None
+    cache.set('b', 2, ttl=30)
+    cache['c'] = 3
+    cache['d'] = 4
+    assert sorted(cache) == ['b', 'c', 'd']
+    cache['e'] = 5
+    assert sorted(cache) == ['c', 'd', 'e']
+
+
+def test_cache_bounded():
+    cache = m.Cache(maxsize=100)
+    for n in range(1000):
+        cache[n] = n
+        cache.get(n // 2)
+    assert len(cache) == 100
+    assert cache.evictions == 900
+    assert len(cache._meta) == 100
+
+
+def test_cache_retries_and_rollbacks():
+    cache = m.Cache(maxsize=2)
+    cache['a'], cache['b'] = 1, 2
+    other = m.Int()
+    calls = []
+    @m.atomically
+    def insert():
+        other.data # read, so that a commit from another thread aborts us
+        cache['c'] = 3
+        if not calls:
+            calls.append(1)
+            thread = threading.Thread(target=other.__iadd__, args=(1, ))
+            thread.start()
+            thread.join()
+    insert()
+    assert len(calls) == 1 and sorted(cache) == ['b', 'c']
+    assert cache.evictions == 1
+    assert sorted(cache._meta) == ['b', 'c']
+    def fun(instance_list, read_list):
+        cache['d'] = 4
+        raise ValueError
+    @m.atomically
+    def rolled_back():
+        try:
+            Action().transaction(other, write_action=fun)
+        except ValueError:
+            pass
+    rolled_back()
+    assert sorted(cache) == ['b', 'c'] and cache.evictions == 1
+    assert sorted(cache._meta) == ['b', 'c']
+
+
+def test_hits_are_not_writes():
+    cache = m.Cache()
+    cache['a'] = 1
+    version = cache.version
+    for _ in range(10):
+        cache['a']
+    assert cache.version == version
+    assert cache.hits == 10
+
+
+def test_get_or_compute_single_flight():
+    cache = m.Cache()
+    calls = []
+    started = threading.Event()
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return 'value'
+    results = []
+    def funk():
+        results.append(cache.get_or_compute('key', compute))
+    thread_list = [threading.Thread(target=funk) for _ in range(8)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert calls == [1]
+    assert results == ['value'] * 8
+    assert cache.get_or_compute('key', compute) == 'value'
+    assert calls == [1]
+
+
+def test_get_or_compute_error():
+    cache = m.Cache()
+    def fail():
+        raise ZeroDivisionError
+    with pytest.raises(ZeroDivisionError):
+        cache.get_or_compute('key', fail)
+    assert 'key' not in cache
+    assert cache.get_or_compute('key', lambda: 1) == 1
+
+
+def test_memoize():
+    calls = []
+    @m.memoize
+    def square(x, offset=0):
+        calls.append(x)
+        return x * x + offset
+    assert square(3) == 9
+    assert square(3) == 9
+    assert square(3, offset=1) == 10
+    assert calls == [3, 3]
+    @m.memoize(maxsize=2)
+    def identity(x):
+        return x
+    for n in range(5):
+        identity(n)
+    assert len(identity.cache) == 2
+
+
+def test_cache_pickle():
+    cache = m.Cache(maxsize=2)
+    cache['a'], cache['b'] = 1, 2
+    other = pickle.loads(pickle.dumps(cache))
+    assert other['a'] == 1 and other.maxsize == 2
+    other['c'] = 3
+    assert len(other) == 2 and 'b' not in other
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import random
+import time
+
+import pytest
+
+import tram as m
+from tram.executor import dependencies, observe
+
+
+def test_observe():
+    left, right, other = m.Int(), m.Int(), m.Dict()
+    assert observe((left, 1, [right], {'key' : other})) == [left, right, other]
+
+
+def test_dependencies():
+    a, b, c, d = m.Int(), m.Int(), m.Int(), m.Int()
+    tasks = [
+        m.Task(m.transfer_value, a, b, 1),
+        m.Task(m.transfer_value, c, d, 1),
+        m.Task(dict, instances=[b]),
+        m.Task(dict),
+        m.Task(m.transfer_value, d, a, 1),
+    ]
+    assert dependencies(tasks) == [[], [], [0], [], [0, 1]]
+    with m.Executor() as executor:
+        batch = executor.submit(tasks)
+        batch.wait()
+    assert (batch.conflicts, batch.depth) == (3, 2)
+
+
+def test_executor_transfers():
+    accounts = [m.Int(100) for _ in range(20)]
+    transfers = [
+        (m.transfer_value, ) + tuple(random.sample(accounts, 2)) + (random.randint(1, 10), )
+        for _ in range(2000)
+    ]
+    expected = [100] * len(accounts)
+    index = {id(account) : n for n, account in enumerate(accounts)}
+    for __, left, right, amount in transfers:
+        expected[index[id(left)]] -= amount
+        expected[index[id(right)]] += amount
+    with m.Executor(max_workers=4) as executor:
+        batch = executor.submit(transfers)
+        assert batch.wait() == [None] * len(transfers)
+    assert batch.done()
+    assert batch.throughput > 0
+    assert [account.data for account in accounts] == expected
+
+
+def test_executor_preserves_order():
+    log = m.List()
+    def append(value):
+        log.append(value)
+        return value
+    with m.Executor(max_workers=4) as executor:
+        results = executor.run([m.Task(append, n, instances=[log]) for n in range(100)])
+    assert results == list(range(100))
+    assert log == list(range(100))
+
+
+def test_executor_errors():
+    def fail():
+        raise KeyError('missing')
+    with m.Executor() as executor:
+        batch = executor.submit([(fail, ), (len, [1, 2])])
+        with pytest.raises(KeyError):
+            batch.wait()
+        assert batch.futures[1].result() == 2
+        assert executor.run([]) == []
+
+
+def test_executor_shutdown_waits():
+    a, b = m.Int(), m.Int()
+    def add(*instances):
+        time.sleep(0.01)
+        for instance in instances:
+            instance += 1
+    with m.Executor() as executor:
+        batch = executor.submit([m.Task(add, a, b), m.Task(add, a), m.Task(add, b)])
+    batch.wait(1)
+    assert a == 2 and b == 2
+    executor = m.Executor()
+    batch = executor.submit([m.Task(add, a, b), m.Task(add, a), m.Task(add, b)])
+    executor.shutdown(wait=False)
+    batch.wait(1)
+    assert a == 4 and b == 4
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import threading
+
+import tram as m
+import tram.feed as f
+
+
+def test_dict_events():
+    d = m.Dict({'one' : 1, 'two' : 2})
+    with d.subscribe() as subscription:
+        old_version = d.version
+        d['three'] = 3
+        del d['one']
+        first = subscription.get(timeout=1)
+        second = subscription.get(timeout=1)
+    assert first.instance is d
+    assert first.old_version == old_version
+    assert first.version == second.old_version
+    assert second.version == d.version
+    assert first.delta == f.DictDelta({'three'}, set())
+    assert second.delta == f.DictDelta(set(), {'one'})
+    assert subscription.get() is None
+
+def test_list_events():
+    l = m.List([0, 1, 2, 3])
+    with l.subscribe() as subscription:
+        l[1] = 10
+        l.append(4)
+        assert subscription.get(timeout=1).delta == f.ListDelta(1, 2, 2)
+        assert subscription.get(timeout=1).delta == f.ListDelta(4, 4, 5)
+
+def test_number_events():
+    i = m.Int(1)
+    with i.subscribe() as subscription:
+        i += 2
+        assert subscription.get(timeout=1).delta == 2
+
+def test_multi_instance_transaction():
+    left, right = m.Int(5), m.Int(0)
+    with left.subscribe() as l, right.subscribe() as r:
+        m.transfer_value(left, right, 5)
+        assert l.get(timeout=1).delta == -5
+        assert r.get(timeout=1).delta == 5
+
+def test_callback():
+    l = m.List()
+    received = []
+    done = threading.Event()
+    def callback(event):
+        received.append(event.instance)
+        done.set()
+    subscription = l.subscribe(callback)
+    l.append(0)
+    assert done.wait(1)
+    subscription.close()
+    assert received == [l]
+
+def test_bounded_queue_drops():
+    i = m.Int()
+    subscription = i.subscribe(maxsize=2)
+    for _ in range(5):
+        i += 1
+    assert subscription.dropped == 3
+    subscription.close()
+    assert i._subscribers == ()
+
+def test_concurrent_drops_are_counted():
+    i = m.Int()
+    subscription = i.subscribe(maxsize=1)
+    def funk():
+        for _ in range(200):
+            i.__iadd__(1)
+    thread_list = [threading.Thread(target=funk) for _ in range(8)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert subscription.dropped == 1600 - 1
+    subscription.close()
+
+def test_iteration_ends_on_close():
+    i = m.Int()
+    subscription = i.subscribe()
+    i += 1
+    subscription.close()
+    assert [event.delta for event in subscription] == [1]
+    assert subscription.get() is None
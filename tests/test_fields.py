@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import copy
+import pickle
+import threading
+
+import pytest
+
+import tram as m
+from tram.fields import Cell, Field
+
+
+@m.transactional
+class Account:
+    balance: int = 0
+    owner: str = ''
+    visits: int = 0
+
+
+@m.transactional
+class Point:
+    __slots__ = ('label', )
+    x: float
+    y: float
+
+    def __init__(self, x, y, label=''):
+        self.x = x
+        self.y = y
+        self.label = label
+
+    def norm(self):
+        return (self.x ** 2 + self.y ** 2) ** 0.5
+
+
+def test_fields():
+    account = Account(owner='ann')
+    assert (account.balance, account.owner) == (0, 'ann')
+    assert Account._fields == ('balance', 'owner', 'visits')
+    assert isinstance(Account.balance, Field)
+    assert isinstance(account._cell_balance, Cell)
+    assert not hasattr(account, '__dict__')
+    version = account._cell_balance.version
+    account.balance = 10
+    assert account.balance == 10
+    assert account._cell_balance.version > version
+    assert repr(account) == "Account(balance=10, owner='ann', visits=0)"
+    with pytest.raises(TypeError):
+        Account(1)
+    with pytest.raises(TypeError):
+        Account(colour='red')
+
+
+class Base:
+    def __init__(self, kind='base'):
+        self.kind = kind
+
+    def describe(self):
+        return self.kind
+
+
+@m.transactional
+class Labelled(Base):
+    name: str = ''
+
+    def __init__(self, name):
+        super().__init__(kind='labelled')
+        self.name = name
+
+    def describe(self):
+        return super().describe() + ' ' + self.name
+
+    @property
+    def title(self):
+        return super().describe().title()
+
+    @classmethod
+    def make(cls):
+        return super(__class__, cls).__new__(cls) is not None
+
+
+def test_fields_zero_argument_super():
+    labelled = Labelled('x')
+    assert labelled.kind == 'labelled' and labelled.name == 'x'
+    assert labelled.describe() == 'labelled x'
+    assert labelled.title == 'Labelled'
+    assert Labelled.make()
+
+
+def test_fields_custom_init():
+    point = Point(3, 4, label='p')
+    assert point.norm() == 5
+    assert point.label == 'p'
+    assert point.y == 4
+
+
+def test_atomically():
+    left, right = Account(balance=10), Account()
+    counter = m.Int()
+    @m.atomically
+    def move(amount):
+        left.balance -= amount
+        right.balance += amount
+        counter.__iadd__(1)
+        return left.balance
+    assert move(3) == 7
+    assert (left.balance, right.balance, counter) == (7, 3, 1)
+
+
+def test_atomically_rolls_back():
+    account = Account(balance=10)
+    @m.atomically
+    def fail():
+        account.balance = 0
+        raise KeyError
+    with pytest.raises(KeyError):
+        fail()
+    assert account.balance == 10
+
+
+def test_atomically_inside_transaction():
+    account = Account()
+    i = m.Int(5)
+    def fun(instance_list, read_list):
+        account.balance = read_list[0]
+        yield i, read_list[0] + 1
+    m.objects.Action().transaction(i, write_action=fun)
+    assert (account.balance, i) == (5, 6)
+
+
+def test_field_safety():
+    account = Account()
+    @m.atomically
+    def deposit():
+        account.balance += 1
+    @m.atomically
+    def visit():
+        account.visits += 1
+    def funk(function):
+        for _ in range(200):
+            function()
+    thread_list = [
+        threading.Thread(target=funk, args=(function, ))
+        for function in (deposit, visit) for _ in range(4)
+    ]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert (account.balance, account.visits) == (800, 800)
+
+
+def test_no_write_skew():
+    # each transaction reads the field the other writes, and sleeps while
+    # holding its lock so that the other validates in the meantime
+    account = Account(balance=1, visits=1)
+    def drain_balance():
+        if account.balance + account.visits == 2:
+            account.balance = 0
+    def drain_visits():
+        if account.balance + account.visits == 2:
+            account.visits = 0
+    for _ in range(20):
+        account.balance, account.visits = 1, 1
+        thread_list = [
+            threading.Thread(target=m.objects.Action(sleep=1e-3).run, args=(function, ))
+            for function in (drain_balance, drain_visits)
+        ]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        assert account.balance + account.visits == 1
+
+
+def test_new_fields_in_transactions():
+    @m.atomically
+    def make():
+        return Account(balance=1).balance
+    assert make() == 1
+
+
+def test_pickle_fields():
+    account = Account(balance=3, owner='ann')
+    for other in (pickle.loads(pickle.dumps(account)), copy.deepcopy(account)):
+        assert (other.balance, other.owner) == (3, 'ann')
+        other.balance = 4
+        assert account.balance == 3
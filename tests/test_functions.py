@@ -47,3 +47,12 @@ def test_transfer_item_dict():
     assert left_data_id != id(left.data)
     assert right_obj_id == id(right)
     assert right_data_id != id(right.data)
+
+def test_transfer_item_keeps_snapshots():
+    left = m.List([1, 2])
+    right = m.Dict()
+    snapshot = left.data
+    m.transfer_item(left, right, 0)
+    assert snapshot == [1, 2]
+    assert left == [2]
+    assert right == {0 : 1}
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import os
+import threading
+
+import pytest
+
+import tram as m
+import tram.journal as j
+
+
+@pytest.mark.parametrize('fsync', j.FSYNC_POLICIES)
+def test_journal_recover(tmpdir, fsync):
+    path = str(tmpdir)
+    d = m.Dict({'one' : 1})
+    i = m.Int(1)
+    with m.Journal(path, {'d' : d, 'i' : i}, fsync=fsync):
+        d['two'] = 2
+        i += 41
+        m.transfer_value(i, m.Int(), 2)
+    recovered = m.recover(path)
+    assert recovered['d'] == {'one' : 1, 'two' : 2}
+    assert recovered['i'] == 40
+    assert recovered['i'].version == i.version
+    assert isinstance(recovered['i'], m.Int)
+
+def test_journal_untracked(tmpdir):
+    path = str(tmpdir)
+    with m.Journal(path, {'l' : m.List()}):
+        m.List().append(1)
+    assert os.path.getsize(os.path.join(path, j.LOG_NAME)) == 0
+
+def test_journal_checkpoint(tmpdir):
+    path = str(tmpdir)
+    l = m.List()
+    with m.Journal(path, {'l' : l}, checkpoint_every=3):
+        for item in range(10):
+            l.append(item)
+    assert os.path.getsize(os.path.join(path, j.LOG_NAME)) > 0
+    assert m.recover(path)['l'] == list(range(10))
+
+def test_journal_torn_write(tmpdir):
+    path = str(tmpdir)
+    l = m.List()
+    with m.Journal(path, {'l' : l}):
+        l.append(0)
+        l.append(1)
+    with open(os.path.join(path, j.LOG_NAME), 'r+b') as fileobj:
+        fileobj.truncate(os.path.getsize(fileobj.name) - 1)
+    assert m.recover(path)['l'] == [0]
+
+def test_journal_stale_log(tmpdir):
+    path = str(tmpdir)
+    # a snapshot taken after commits whose log entries weren't truncated yet
+    with open(os.path.join(path, j.SNAPSHOT_NAME), 'wb') as fileobj:
+        j.write_frame(fileobj, {'l' : ('List', [0, 1], 20.0)})
+    with open(os.path.join(path, j.LOG_NAME), 'wb') as fileobj:
+        j.write_frame(fileobj, [('l', 'List', [0], 10.0)])
+        j.write_frame(fileobj, [('l', 'List', [0, 1, 2], 30.0), ('i', 'Int', 5, 30.0)])
+        j.write_frame(fileobj, [('l', 'List', [0, 1], 20.0)])
+    recovered = m.recover(path)
+    assert recovered['l'] == [0, 1, 2] and recovered['l'].version == 30.0
+    assert recovered['i'] == 5
+
+def test_journal_versions_ahead_of_clock(tmpdir):
+    path = str(tmpdir)
+    version = j.CLOCK.now() + 1000
+    with open(os.path.join(path, j.SNAPSHOT_NAME), 'wb') as fileobj:
+        j.write_frame(fileobj, {'i' : ('Int', 10, version)})
+    i = m.recover(path)['i']
+    m.transfer_value(i, m.Int(), 1)
+    assert i == 9 and i.version > version
+
+def test_journal_refuses_unpicklable(tmpdir):
+    path = str(tmpdir)
+    d = m.Dict({'one' : 1})
+    with m.Journal(path, {'d' : d}):
+        with pytest.raises(Exception):
+            d['f'] = lambda: 1
+        assert 'f' not in d
+        d['two'] = 2
+    assert m.recover(path)['d'] == {'one' : 1, 'two' : 2}
+
+def test_journal_write_failure(tmpdir):
+    class Broken:
+        def write(self, data):
+            raise OSError("disk full")
+        def close(self):
+            pass
+    seen = []
+    class Hook(j.CommitHook):
+        def after_commit(self, changes):
+            seen.append(changes[0].value)
+    d, other = m.Dict(), m.Int()
+    journal = m.Journal(str(tmpdir), {'d' : d}, fsync='always')
+    with journal:
+        j.Action.hooks.append(Hook())
+        try:
+            journal._log.close()
+            journal._log = Broken()
+            with pytest.raises(j.JournalError):
+                d['x'] = 1
+            assert d == {'x' : 1} and seen == [{'x' : 1}]
+            assert isinstance(journal.error, OSError)
+            with pytest.raises(j.JournalError):
+                d['y'] = 2
+            assert 'y' not in d
+            other += 1
+            assert other == 1
+        finally:
+            j.Action.hooks.pop()
+
+def test_journal_threads(tmpdir):
+    path = str(tmpdir)
+    shared = m.List()
+    with m.Journal(path, {'shared' : shared}):
+        thread_list = [threading.Thread(target=shared.append, args=(n, )) for n in range(20)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+    assert sorted(m.recover(path)['shared']) == list(range(20))
+
+def test_journal_detaches(tmpdir):
+    journal = m.Journal(str(tmpdir))
+    with journal:
+        assert journal in j.Action.hooks
+    assert journal not in j.Action.hooks
+
+def test_journal_bad_policy(tmpdir):
+    with pytest.raises(ValueError):
+        m.Journal(str(tmpdir), fsync='sometimes')
+
+def test_journal_nested_objects(tmpdir):
+    path = str(tmpdir)
+    d = m.Dict({'one' : m.Int(1)})
+    with m.Journal(path, {'d' : d}):
+        d['two'] = m.Int(2)
+    assert m.recover(path)['d'] == {'one' : 1, 'two' : 2}
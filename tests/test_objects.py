@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
+import copy
+import pickle
+import queue
+import threading
 import time
 import pytest
 
@@ -114,6 +118,7 @@ def test_int_iter():
 
 def test_int_version():
     i = m.Int()
+    i += 1
     with pytest.raises(ValueError):
         i.version = 0
 
@@ -326,6 +331,15 @@ def test_list_iter():
     assert output is not l
     assert output is not l.data
 
+def test_list_iter_snapshot():
+    l = m.List(range(3))
+    iterator = iter(l)
+    assert next(iterator) == 0
+    l.append(3)
+    del l[0]
+    assert list(iterator) == [1, 2]
+    assert list(reversed(l)) == [3, 2, 1]
+
 def test_list_index():
     l = m.List([0, 2])
     output = l.index(2)
@@ -340,6 +354,43 @@ def test_list_reverse():
     assert id(l) == instance_id
     assert id(l.data) != data_id
 
+def test_list_ifilter():
+    left = m.List(range(6))
+    left.ifilter(lambda x: x % 2)
+    assert left == [1, 3, 5]
+
+def test_list_bulk_operations():
+    from concurrent.futures import ThreadPoolExecutor
+    data = [(n * 7919) % 1000 for n in range(1000)]
+    left = m.List(data)
+    with ThreadPoolExecutor(4) as executor:
+        left.map_inplace(lambda x: x * 2, executor=executor, chunksize=64)
+        assert left == [x * 2 for x in data]
+        left.filter_inplace(lambda x: x % 3, executor=executor)
+        expected = [x * 2 for x in data if (x * 2) % 3]
+        assert left == expected
+        assert left.reduce(lambda x, y: x + y, executor=executor) == sum(expected)
+        assert left.reduce(lambda x, y: x + y, 10, executor=executor) == sum(expected) + 10
+        left.sort(key=lambda x: -x, executor=executor, chunksize=100)
+        assert left == sorted(expected, reverse=True)
+        left.sort(reverse=True, executor=executor)
+        assert left == sorted(expected, reverse=True)
+    assert m.List().reduce(lambda x, y: x + y, 0) == 0
+
+def test_list_bulk_retries():
+    left = m.List(range(10))
+    calls = []
+    def double(x):
+        if not calls:
+            calls.append(x)
+            # commit from another thread while the map is running
+            thread = threading.Thread(target=left.append, args=(10, ))
+            thread.start()
+            thread.join()
+        return x * 2
+    left.map_inplace(double)
+    assert left == [x * 2 for x in range(11)]
+
 #######################
 # The dictionary object
 #######################
@@ -425,8 +476,388 @@ def test_dict_values():
     left = m.Dict(one=1, two=2)
     assert sorted(left.values()) == sorted([1, 2])
 
+def test_dict_views_snapshot():
+    d = m.Dict({'one' : 1})
+    keys, values, items = d.keys(), d.values(), d.items()
+    iterator = iter(d)
+    d['two'] = 2
+    del d['one']
+    assert list(keys) == ['one']
+    assert list(values) == [1]
+    assert list(items) == [('one', 1)]
+    assert list(iterator) == ['one']
+    assert list(d.keys()) == ['two']
+
 def test_dict_iter():
     d = m.Dict({'one' : 1, 'two' : 2})
     output = list(iter(d))
     assert sorted(output) == sorted(['one', 'two'])
     assert output is not d.data
+
+#######################
+# The Action object
+#######################
+
+def test_action_nested_join():
+    queue = m.List([1, 2, 3])
+    total = m.Int(0)
+    def fun(instance_list, read_list):
+        for instance, value in zip(instance_list, read_list):
+            yield instance, value + queue.pop()
+    m.Action().transaction(total, write_action=fun)
+    assert total == 3
+    assert queue == [1, 2]
+    assert m.Action.current() is None
+
+def test_action_nested_sees_outer_writes():
+    l = m.List([1])
+    seen = []
+    def fun(instance_list, read_list):
+        yield l, read_list[0] + [2]
+        seen.append(l.pop())
+    m.Action().transaction(l, write_action=fun)
+    assert seen == [2]
+    assert l == [1]
+
+def test_action_nested_rollback():
+    left = m.List([1])
+    right = m.Dict({'one' : 1})
+    def inner(instance_list, read_list):
+        right.update({'two' : 2})
+        del right['missing']
+        yield from ()
+    def fun(instance_list, read_list):
+        left.append(2)
+        try:
+            m.Action().transaction(right, write_action=inner)
+        except KeyError:
+            pass
+        yield from ()
+    m.Action().transaction(left, write_action=fun)
+    assert left == [1, 2]
+    assert right == {'one' : 1}
+
+def test_action_savepoint():
+    i = m.Int(0)
+    do = m.Action()
+    with do:
+        do.write([(i, 1)])
+        savepoint = do.savepoint()
+        do.write([(i, 2)])
+        do.rollback(savepoint)
+        assert do.read([i]) == [1]
+
+def test_action_same_instance_twice():
+    i = m.Int(1)
+    def fun(instance_list, read_list):
+        yield instance_list[-1], read_list[-1] + 1
+    m.Action().transaction(i, i, write_action=fun)
+    assert i == 2
+
+def test_action_commute():
+    i = m.Int(1)
+    version = i.version
+    def fun(instance_list, read_list):
+        yield i, read_list[0] + 1
+    m.Action().commute(i, write_action=fun)
+    assert i == 2
+    assert i.version > version
+
+def test_action_read_aborts_early():
+    left, right = m.Int(0), m.Int(0)
+    attempts = []
+    def fun(instance_list, read_list):
+        attempts.append(read_list)
+        if len(attempts) == 1:
+            bump = threading.Thread(target=right.__iadd__, args=(1, ))
+            bump.start()
+            bump.join()
+        yield left, read_list[0] + right.data
+        do = m.Action.current()
+        do.read([right])
+        attempts.append('read right')
+    m.Action().transaction(left, write_action=fun)
+    assert attempts == [[0], [0], 'read right']
+    assert left == 1
+
+def test_checkpoint_aborts_early():
+    i = m.Int(0)
+    attempts = []
+    def fun(instance_list, read_list):
+        attempts.append(read_list[0])
+        if len(attempts) == 1:
+            bump = threading.Thread(target=i.__iadd__, args=(1, ))
+            bump.start()
+            bump.join()
+        m.checkpoint()
+        yield i, read_list[0] + 10
+    m.Action().transaction(i, write_action=fun)
+    assert attempts == [0, 1]
+    assert i == 11
+
+def test_clock_ticks():
+    versions = [m.CLOCK.tick() for _ in range(100)]
+    assert versions == sorted(set(versions))
+    assert m.CLOCK.now() >= versions[-1]
+    now = m.CLOCK.now()
+    assert m.CLOCK.tick() > now
+
+def test_clock_advances_to_restored_versions():
+    i = m.Int(1)
+    i.version = m.CLOCK.now() + 5000.5
+    assert m.CLOCK.now() >= i.version
+    version = i.version
+    i += 1
+    assert i.version > version
+    m.Action().transaction(i, m.Int(), write_action=lambda instance_list, read_list: ())
+
+def test_action_apply():
+    l = m.List([1])
+    version = l.version
+    m.Action.apply(l, lambda data: data + [2])
+    assert l == [1, 2]
+    assert l.version > version
+    with pytest.raises(IndexError):
+        m.Action.apply(l, lambda data: data[5])
+    assert l == [1, 2]
+    assert l._locked == False
+
+def test_action_apply_joins():
+    left, right = m.List([1]), m.Int(0)
+    def fun(instance_list, read_list):
+        m.Action.apply(left, lambda data: data + [2])
+        yield right, len(m.Action.current().read([left])[0])
+    m.Action().transaction(right, write_action=fun)
+    assert left == [1, 2]
+    assert right == 2
+
+#######################
+# The set object
+#######################
+
+def test_set_init():
+    s = m.Set()
+    assert s == set()
+    assert repr(s) == "Set()"
+    s = m.Set([1, 2, 2])
+    assert s == {1, 2}
+    assert repr(s) == "Set({1, 2})"
+
+def test_set_add_discard():
+    s = m.Set([1])
+    data = s.data
+    s.add(2)
+    s.discard(1)
+    s.discard(3)
+    assert s == {2}
+    assert data == {1}
+    with pytest.raises(KeyError):
+        s.remove(1)
+
+def test_set_pop():
+    s = m.Set([1])
+    assert s.pop() == 1
+    assert s == set()
+    with pytest.raises(KeyError):
+        s.pop()
+
+def test_set_inplace_algebra():
+    s = m.Set(range(5))
+    _id = id(s)
+    version = s.version
+    s |= range(10)
+    s &= m.Set(range(3, 20))
+    s -= {9}
+    assert s == set(range(3, 9))
+    assert id(s) == _id
+    assert s.version > version
+
+def test_set_algebra():
+    s = m.Set([1, 2])
+    assert isinstance(s | {3}, m.Set)
+    assert s | {3} == {1, 2, 3}
+    assert s & {2} == {2}
+    assert s - {2} == {1}
+    assert s ^ {2, 3} == {1, 3}
+    assert s.issubset([1, 2, 3])
+    assert s.issuperset([1])
+    assert s.isdisjoint([3])
+
+def test_set_copy_clear():
+    s = m.Set([1])
+    t = s.copy()
+    s.clear()
+    assert s == set()
+    assert t == {1}
+    assert 1 in t
+    assert len(t) == 1
+
+#######################
+# The sorted objects
+#######################
+
+def test_sorted_list():
+    s = m.SortedList([3, 1, 2])
+    assert s == [1, 2, 3]
+    assert repr(s) == "SortedList([1, 2, 3])"
+    data = s.data
+    s.add(0)
+    s.update([5, 4])
+    s.remove(3)
+    s.discard(30)
+    assert s == [0, 1, 2, 4, 5]
+    assert data == [1, 2, 3]
+    assert s[-1] == 5
+    assert s.pop(0) == 0
+    assert s.bisect_left(4) == 2
+    assert s.bisect_right(4) == 3
+    assert list(s.irange(2, 4)) == [2, 4]
+    assert list(s.irange(2, 4, inclusive=(False, False))) == []
+    assert list(reversed(s)) == [5, 4, 2, 1]
+    with pytest.raises(ValueError):
+        s.remove(30)
+
+def test_sorted_dict():
+    d = m.SortedDict({'b' : 2, 'a' : 1})
+    assert list(d) == ['a', 'b']
+    assert repr(d) == "SortedDict({'a': 1, 'b': 2})"
+    d['c'] = 3
+    d['a'] = 0
+    del d['b']
+    assert d == {'a' : 0, 'c' : 3}
+    assert list(d.items()) == [('a', 0), ('c', 3)]
+    assert d.peekitem() == ('c', 3)
+    d.update({'d' : 4, 'a' : -1})
+    assert list(d.irange('b', 'd')) == ['c', 'd']
+    assert d.popitem(0) == ('a', -1)
+    assert list(d.keys()) == ['c', 'd']
+    with pytest.raises(KeyError):
+        del d['missing']
+    assert m.SortedDict(one=1) == {'one' : 1}
+
+#######################
+# The priority queue
+#######################
+
+def test_priority_queue():
+    q = m.PriorityQueue([3, 1])
+    q.push(2)
+    q.push_many([5, 0, 4])
+    assert repr(q) == "PriorityQueue([0, 1, 2, 3, 4, 5])"
+    assert q.peek() == 0
+    assert len(q) == 6
+    assert [q.pop_min() for _ in range(6)] == [0, 1, 2, 3, 4, 5]
+    with pytest.raises(IndexError):
+        q.pop_min()
+    with pytest.raises(IndexError):
+        q.peek()
+
+def test_priority_queue_nonblocking():
+    q = m.PriorityQueue()
+    with pytest.raises(queue.Empty):
+        q.pop(block=False)
+    with pytest.raises(queue.Empty):
+        q.pop(timeout=0.01)
+
+def test_priority_queue_blocking():
+    q = m.PriorityQueue()
+    result = []
+    consumer = threading.Thread(target=lambda: result.append(q.pop(timeout=5)))
+    consumer.start()
+    time.sleep(0.01)
+    q.push((1, 'job'))
+    consumer.join()
+    assert result == [(1, 'job')]
+    assert len(q) == 0
+
+def test_priority_queue_pickle_and_copy():
+    q = m.PriorityQueue()
+    with pytest.raises(queue.Empty):
+        q.pop(timeout=0.001) # attaches the notifier
+    q.push_many([2, 1])
+    for other in (pickle.loads(pickle.dumps(q)), copy.copy(q), copy.deepcopy(q)):
+        assert sorted(other.data) == [1, 2]
+        assert other._notifier is not q._notifier and not other._watched
+        assert [other.pop(), other.pop()] == [1, 2]
+        result = []
+        consumer = threading.Thread(target=lambda: result.append(other.pop(timeout=5)))
+        consumer.start()
+        time.sleep(0.01)
+        other.push(3)
+        consumer.join()
+        assert result == [3]
+    assert sorted(q.data) == [1, 2]
+
+def test_new_objects_in_transactions():
+    i = m.Int(1)
+    def fun(instance_list, read_list):
+        scratch = m.List()
+        scratch.append(read_list[0])
+        yield i, read_list[0] + 1
+    m.Action().transaction(i, write_action=fun)
+    assert i == 2
+    def make():
+        scratch = m.List()
+        scratch.append(1)
+        assert len(scratch) == 1
+        return scratch
+    assert m.Action().run(make) == [1]
+
+def test_reads_see_own_writes():
+    d, l = m.Dict(), m.List([1, 2, 3])
+    def fun():
+        d['x'] = 1
+        l.append(4)
+        return d.get('x'), d['x'], 'x' in d, list(d), len(l), 4 in l, l[-1], l == [1, 2, 3, 4]
+    assert m.Action().run(fun) == (1, 1, True, ['x'], 4, True, 4, True)
+    assert d == {'x' : 1} and l == [1, 2, 3, 4]
+
+def test_reads_are_validated():
+    source, target = m.Int(1), m.Int(0)
+    calls = []
+    def fun():
+        value = source.data
+        if not calls:
+            calls.append(value)
+            # commit from another thread after the read
+            thread = threading.Thread(target=source.__iadd__, args=(1, ))
+            thread.start()
+            thread.join()
+        m.Action.apply(target, lambda data: value)
+    m.Action().run(fun)
+    assert target == 2
+
+def test_read_waits_for_commit():
+    left, right = m.Int(1), m.Int(1)
+    seen = []
+    def fun(instance_list, read_list):
+        seen.append(tuple(read_list))
+        return ()
+    # hold a lock as a committing transaction would, and publish halfway
+    right.__enter__()
+    try:
+        left.publish(2, m.CLOCK.tick())
+        thread = threading.Thread(target=m.Action().transaction, args=(left, right),
+                                  kwargs={'write_action' : fun})
+        thread.start()
+        time.sleep(0.01)
+        assert seen == []
+        right.publish(2, left.version)
+    finally:
+        right.__exit__(None, None, None)
+    thread.join()
+    assert seen == [(2, 2)]
+
+def test_pickle_and_copy():
+    d = m.Dict({'one' : m.Int(1)})
+    d.set_combining()
+    for other in (pickle.loads(pickle.dumps(d)), copy.deepcopy(d), copy.copy(d)):
+        assert other == d and other.version == d.version
+        assert other._lock is not d._lock and other._combiner is not None
+        with other:
+            assert not d._locked
+        other['two'] = 2
+        assert 'two' not in d
+    i = copy.deepcopy(d['one'])
+    i += 1
+    assert i == 2 and d['one'] == 1
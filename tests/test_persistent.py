@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import bisect
+import pickle
+import random
+
+import pytest
+
+import tram.persistent as p
+
+
+class Collider:
+    """Distinct keys which all share one hash"""
+
+    def __init__(self, n):
+        self.n = n
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, Collider) and other.n == self.n
+
+
+def test_map_matches_dict():
+    rng = random.Random(0)
+    expected = {}
+    mapping = p.PersistentMap()
+    for _ in range(5000):
+        key = rng.randrange(2000)
+        if rng.random() < 0.3:
+            expected.pop(key, None)
+            mapping = mapping.discard(key)
+        else:
+            expected[key] = key * 2
+            mapping = mapping.set(key, key * 2)
+        assert len(mapping) == len(expected)
+    assert mapping == expected
+    assert sorted(mapping.items()) == sorted(expected.items())
+    assert sorted(mapping.values()) == sorted(expected.values())
+
+def test_map_structure_sharing():
+    before = p.PersistentMap((n, n) for n in range(100))
+    after = before.set('new', 1)
+    assert 'new' not in before
+    assert after['new'] == 1
+    assert len(before) == 100
+    assert len(after) == 101
+    assert before.set(1, 1) is before
+
+def test_map_delete():
+    mapping = p.PersistentMap({'one' : 1})
+    with pytest.raises(KeyError):
+        mapping.delete('two')
+    assert mapping.delete('one') == {}
+    with pytest.raises(KeyError):
+        mapping['two']
+
+def test_map_collisions():
+    keys = [Collider(n) for n in range(5)]
+    mapping = p.PersistentMap((key, key.n) for key in keys)
+    assert [mapping[key] for key in keys] == list(range(5))
+    for key in keys:
+        mapping = mapping.delete(key)
+    assert len(mapping) == 0
+    assert Collider(0) not in mapping
+
+def test_map_pickle():
+    mapping = p.PersistentMap({'one' : 1})
+    assert pickle.loads(pickle.dumps(mapping)) == mapping
+
+def test_set_algebra():
+    left = p.PersistentSet(range(10))
+    right = {5, 6, 7, 20}
+    assert left | right == set(range(10)) | right
+    assert left & right == {5, 6, 7}
+    assert left - right == set(range(5)) | {8, 9}
+    assert left ^ right == set(range(10)) ^ right
+    assert left.add(3) is left
+    assert left.discard(30) is left
+    assert isinstance(left | right, p.PersistentSet)
+    assert pickle.loads(pickle.dumps(left)) == left
+
+def test_sorted_list_matches_list():
+    rng = random.Random(1)
+    expected = []
+    result = p.PersistentSortedList()
+    for _ in range(4000):
+        item = rng.randrange(500)
+        if expected and rng.random() < 0.4:
+            item = rng.choice(expected)
+            expected.remove(item)
+            result = result.remove(item)
+        else:
+            expected.append(item)
+            expected.sort()
+            result = result.add(item)
+    assert list(result) == expected
+    assert len(result) == len(expected)
+    assert [result[n] for n in range(len(expected))] == expected
+    for item in range(0, 500, 7):
+        assert result.bisect_left(item) == bisect.bisect_left(expected, item)
+        assert result.bisect_right(item) == bisect.bisect_right(expected, item)
+        assert result.count(item) == expected.count(item)
+    assert result[10:20] == expected[10:20]
+    assert list(result.irange(100, 200)) == [n for n in expected if 100 <= n <= 200]
+
+def test_sorted_list_bulk():
+    result = p.PersistentSortedList(range(1000, 0, -1))
+    assert list(result) == list(range(1, 1001))
+    before = result
+    result = result.update(range(3))
+    assert len(before) == 1000
+    assert list(result)[:4] == [0, 1, 1, 2]
+    for item in list(result):
+        result = result.remove(item)
+    assert len(result) == 0
+    with pytest.raises(ValueError):
+        result.remove(1)
+
+def test_sorted_map():
+    mapping = p.PersistentSortedMap({3 : 'c', 1 : 'a'})
+    mapping = mapping.set(2, 'b')
+    assert list(mapping) == [1, 2, 3]
+    assert mapping.delete(2) == {1 : 'a', 3 : 'c'}
+    assert pickle.loads(pickle.dumps(mapping)) == mapping
+
+def test_sorted_map_update():
+    mapping = p.PersistentSortedMap({3 : 'c', 1 : 'a'})
+    result = mapping.update(iter([(2, 'b'), (3, 'C'), (2, 'B')]))
+    assert list(result.items()) == [(1, 'a'), (2, 'B'), (3, 'C')]
+    words = p.PersistentSortedMap({'b' : 2}).update({'c' : 3}, a=1)
+    assert list(words.items()) == [('a', 1), ('b', 2), ('c', 3)]
+    assert mapping.update({1 : 'A'}).keys() is mapping.keys()
+
+def test_heap():
+    rng = random.Random(2)
+    items = [rng.randrange(1000) for _ in range(500)]
+    heap = p.PersistentHeap(items[:250]).push_many(items[250:400])
+    for item in items[400:]:
+        heap = heap.push(item)
+    assert len(heap) == 500
+    assert sorted(heap) == sorted(items)
+    before = heap
+    result = []
+    while len(heap):
+        item, heap = heap.pop()
+        result.append(item)
+    assert result == sorted(items)
+    assert len(before) == 500
+    assert pickle.loads(pickle.dumps(before)).peek() == min(items)
+    with pytest.raises(IndexError):
+        heap.pop()
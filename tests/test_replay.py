@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import os
+import threading
+
+import pytest
+
+import tram as m
+from tram.objects import Action
+from tram.replay import Recorder, Scheduler, Step, load, replay, save
+
+
+def workload():
+    accounts = [m.Int(100) for _ in range(4)]
+    def funk(offset):
+        for n in range(25):
+            m.transfer_value(accounts[(n + offset) % 4], accounts[(n + offset + 1) % 4], 1)
+    thread_list = [threading.Thread(target=funk, args=(offset, )) for offset in range(3)]
+    with Recorder() as recorder:
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+    return recorder.steps
+
+
+def test_recorder():
+    steps = workload()
+    assert Action.tracer is None
+    assert len(steps) == 75
+    assert {step.thread for step in steps} == {0, 1, 2}
+    assert all(len(step.reads) == len(step.writes) == 2 for step in steps)
+    assert {index for step in steps for index in step.writes} == {0, 1, 2, 3}
+    assert all(step.attempts >= 1 and step.duration >= 0 for step in steps)
+
+
+def test_recorder_single_object_updates():
+    i, d, l = m.Int(), m.Dict(), m.List()
+    with Recorder() as recorder:
+        for n in range(10):
+            i += 1
+            d[n] = n
+            l.append(n)
+    assert len(recorder.steps) == 30
+    assert [step.writes for step in recorder.steps[:3]] == [[0], [1], [2]]
+    assert all(step.reads == step.writes and step.attempts == 1 for step in recorder.steps)
+    l.set_combining()
+    with Recorder() as recorder:
+        l.append(10)
+    assert [step.writes for step in recorder.steps] == [[0]]
+    assert replay(recorder.steps).commits == 1
+
+
+def test_save_load(tmpdir):
+    steps = workload()
+    path = os.path.join(str(tmpdir), 'steps.json')
+    save(steps, path)
+    assert load(path) == steps
+
+
+def test_replay_free_running():
+    steps = workload()
+    result = replay(steps)
+    assert result.commits == 75
+    assert result.attempts == result.commits + result.aborts
+    assert result.schedule is None
+
+
+def test_replay_is_deterministic():
+    steps = workload()
+    first = replay(steps, scheduler=Scheduler(seed=7, probability=1))
+    second = replay(steps, scheduler=Scheduler(seed=7, probability=1))
+    assert first.commits == 75
+    assert first.aborts > 0
+    assert (first.attempts, first.schedule) == (second.attempts, second.schedule)
+
+
+def test_replay_options():
+    steps = [
+        Step(0, 0.0, [0], [0], 0.0, 1),
+        Step(1, 0.0, [0, 1], [1], 0.0, 1),
+        Step(1, 0.001, [1], [1], 0.0, 1),
+    ]
+    locked = []
+    class Counting(Action):
+        @staticmethod
+        def sequence_lock(instance_list):
+            locked.append(len(instance_list))
+            Action.sequence_lock(instance_list)
+    result = replay(steps, scheduler=Scheduler(seed=1), factory=m.Float, action=Counting)
+    assert result.commits == 3
+    assert locked.count(2) == 1
+    result = replay(steps, time_scale=1)
+    assert result.commits == 3
+
+
+def test_scheduler_errors():
+    def fail():
+        raise KeyError('fail')
+    with pytest.raises(KeyError):
+        Scheduler().run([fail, lambda: None])
+    assert Action.scheduler is None
@@ -6,7 +6,8 @@ import random
 import threading
 import time
 
-from tram import Dict, List
+from tram import Dict, Int, List, transfer_value
+from tram.objects import Action, CommitHook
 
 def test_list_safety():
     shared = List([])
@@ -31,3 +32,78 @@ def test_dict_safety():
     for thread in thread_list:
         thread.join()
     assert len(shared) == 100
+
+def test_combining_safety():
+    counter = Int()
+    tally = Dict()
+    shared = List()
+    for instance in (counter, tally, shared):
+        instance.set_combining()
+    def funk():
+        nonlocal counter
+        for _ in range(20):
+            counter += 1
+            tally.increment('hits')
+            shared.append(0)
+    thread_list = [threading.Thread(target=funk) for _ in range(20)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert counter == 400
+    assert tally['hits'] == 400
+    assert len(shared) == 400
+
+def test_combining_errors():
+    counter = Int()
+    counter.set_combining()
+    with pytest.raises(TypeError):
+        counter += 'one'
+    counter += 1
+    assert counter == 1
+
+def test_combining_batches_when_contended():
+    counter = Int()
+    counter.set_combining()
+    commits = []
+    class Hook(CommitHook):
+        def on_commit(self, changes):
+            commits.append(len(changes))
+    def funk():
+        nonlocal counter
+        counter += 1
+    Action.hooks.append(Hook())
+    try:
+        counter += 1
+        assert commits == [1]
+        # hold the lock as a commit would, so that the updates queue up
+        counter.__enter__()
+        try:
+            thread_list = [threading.Thread(target=funk) for _ in range(10)]
+            for thread in thread_list:
+                thread.start()
+            while len(counter._combiner.pending) < 10:
+                time.sleep(1e-3)
+        finally:
+            counter.__exit__(None, None, None)
+        for thread in thread_list:
+            thread.join()
+    finally:
+        Action.hooks.pop()
+    assert counter == 11
+    assert len(commits) == 2 # all ten queued updates in one commit
+
+def test_transfer_safety():
+    accounts = [Int(100) for _ in range(5)]
+    def funk(seed):
+        rng = random.Random(seed)
+        for _ in range(50):
+            left, right = rng.sample(accounts, 2)
+            transfer_value(left, right, rng.randrange(10))
+    thread_list = [threading.Thread(target=funk, args=(seed, )) for seed in range(10)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert sum(account.data for account in accounts) == 500
+    assert not any(account._locked for account in accounts)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import io
+import threading
+
+import pytest
+
+import tram as m
+import tram.serialize as s
+
+
+def test_roundtrip_objects():
+    for instance in (m.Int(3), m.Float(0.5), m.List([1, 'two', None]), m.Dict({'one' : (1, 1.0)}), m.Set('ab'),
+                     m.SortedList([2, 1]), m.SortedDict({'b' : 2, 'a' : 1})):
+        result = s.loads(s.dumps(instance))
+        assert type(result) is type(instance)
+        assert result == instance
+        assert result is not instance
+        assert result.version == instance.version
+
+def test_roundtrip_values():
+    value = [None, True, False, -1, 2 ** 80, 1.5, 'text', b'raw', (1, 2), {'a' : [1]}, 1j]
+    assert s.loads(s.dumps(m.List(value))) == value
+
+def test_numeric_lists_are_packed():
+    ints = m.List(range(1000))
+    floats = m.List([n / 2 for n in range(1000)])
+    assert len(s.dumps(ints)) < 1000 * 9 + 64
+    assert s.loads(s.dumps(ints)) == list(range(1000))
+    assert s.loads(s.dumps(floats)) == [n / 2 for n in range(1000)]
+    mixed = m.List([1, True])
+    assert s.loads(s.dumps(mixed)).data[1] is True
+
+def test_graph_references():
+    shared = m.Int(1)
+    outer = m.Dict({'left' : shared, 'right' : shared, 'nested' : m.List([shared])})
+    result = s.loads(s.dumps({'outer' : outer, 'shared' : shared}))
+    assert result['outer']['left'] is result['shared']
+    assert result['outer']['nested'][0] is result['shared']
+
+def test_graph_cycle():
+    outer = m.List()
+    outer.append(m.Dict({'parent' : outer}))
+    result = s.loads(s.dumps(outer))
+    assert result[0]['parent'] is result
+
+def test_file_roundtrip():
+    fileobj = io.BytesIO()
+    s.dump(m.Dict(one=1), fileobj)
+    fileobj.seek(0)
+    assert s.load(fileobj) == {'one' : 1}
+
+def test_bad_magic():
+    with pytest.raises(s.FormatError):
+        s.loads(b'nope')
+
+def test_consistent_snapshot():
+    left, right = m.Int(100), m.Int(0)
+    def funk():
+        for _ in range(50):
+            m.transfer_value(left, right, 1)
+    thread = threading.Thread(target=funk)
+    thread.start()
+    for _ in range(50):
+        a, b = s.loads(s.dumps([left, right]))
+        assert a + b == 100
+    thread.join()
+
+def test_snapshot_locks_nothing(monkeypatch):
+    def refuse(instance_list):
+        raise AssertionError("snapshot locked {}".format(instance_list))
+    monkeypatch.setattr(s.Action, 'sequence_lock', staticmethod(refuse))
+    left, right = m.Int(1), m.List([2])
+    assert [data for __, data, __ in s.snapshot([left, right])] == [1, [2]]
+
+def test_priority_queue_roundtrip():
+    result = s.loads(s.dumps(m.PriorityQueue([2, 1, 3])))
+    assert [result.pop_min() for _ in range(3)] == [1, 2, 3]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+from multiprocessing import AuthenticationError
+import os
+import threading
+
+import pytest
+
+from tram import Dict, Int, List
+from tram.server import Client, ConflictError, RemoteError, Server
+
+
+@pytest.fixture(params=['unix', 'tcp'])
+def server(request, tmpdir):
+    if request.param == 'unix':
+        address = os.path.join(str(tmpdir), 'tram.sock')
+    else:
+        address = ('localhost', 0)
+    objects = {'counter' : Int(), 'config' : Dict({'a' : 1}), 'log' : List()}
+    with Server(address, objects, authkey=b'secret') as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    with Client(server.address, authkey=b'secret') as client:
+        yield client
+
+
+def test_read(client):
+    assert client.read('counter', 'config') == {'counter' : 0, 'config' : {'a' : 1}}
+    assert client.names() == ['config', 'counter', 'log']
+
+
+def test_proxy_calls(server, client):
+    counter = client['counter']
+    counter += 5
+    assert server.objects['counter'] == 5
+    config = client['config']
+    config['b'] = 2
+    assert config['b'] == 2
+    assert 'b' in config
+    assert len(config) == 2
+    assert sorted(config.keys()) == ['a', 'b']
+    client['log'].append('x')
+    assert client['log'].get() == ['x']
+
+
+def test_errors(client):
+    with pytest.raises(RemoteError):
+        client.read('missing')
+    with pytest.raises(RemoteError):
+        client.call('config', '_coerce', {})
+    for method in ('publish', 'subscribe', 'set_combining', 'commute', 'map_inplace'):
+        with pytest.raises(RemoteError):
+            client.call('counter', method, 0, 1e18)
+    assert client['counter'].get() == 0
+    with pytest.raises(KeyError):
+        client['config']['missing']
+
+
+def test_authkey_required(tmpdir):
+    with pytest.raises(ValueError):
+        Server(('localhost', 0))
+    address = os.path.join(str(tmpdir), 'open.sock')
+    with Server(address, {'counter' : Int(1)}) as server:
+        with Client(server.address) as client:
+            assert client.read('counter') == {'counter' : 1}
+
+
+def test_wrong_authkey(server, client):
+    with pytest.raises(AuthenticationError):
+        Client(server.address, authkey=b'wrong').read('counter')
+    assert client.read('counter') == {'counter' : 0}
+    with Client(server.address, authkey=b'secret') as other:
+        assert other.read('counter') == {'counter' : 0}
+
+
+def test_pipeline(client):
+    with client.pipeline() as pipe:
+        pipe.call('counter', '__iadd__', 1).call('log', 'append', 'y').read('counter', 'log')
+    results = client.pipeline().read('counter', 'log').execute()
+    assert results == [{'counter' : (1, results[0]['counter'][1]),
+                        'log' : (['y'], results[0]['log'][1])}]
+
+
+def test_conflict(server, client):
+    snapshot, = client.request([('read', ['counter'])])
+    version = snapshot['counter'][1]
+    counter = client['counter']
+    counter += 1
+    with pytest.raises(ConflictError):
+        client.request([('commit', {'counter' : version}, {'counter' : 100})])
+    assert server.objects['counter'] == 1
+
+
+def test_transaction_safety(server):
+    def funk():
+        with Client(server.address, authkey=b'secret') as client:
+            for _ in range(20):
+                client.transaction(
+                    ['counter', 'log'], lambda counter, log: (counter + 1, log + [counter])
+                )
+    thread_list = [threading.Thread(target=funk) for _ in range(4)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert server.objects['counter'] == 80
+    assert server.objects['log'].data == list(range(80))
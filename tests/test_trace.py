@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+import io
+import json
+import threading
+
+import tram as m
+from tram.objects import Action
+from tram.trace import Tracer
+
+
+def phases(events):
+    return [event['name'] for event in events if event['ph'] == 'X']
+
+
+def test_tracer_records_phases():
+    left, right = m.Int(1), m.Int(2)
+    with Tracer() as tracer:
+        assert Action.tracer is tracer
+        m.transfer_value(left, right, 1)
+    assert Action.tracer is None
+    events = tracer.events()
+    assert phases(events) == ['attempt', 'read', 'write', 'lock', 'validate', 'commit']
+    attempt = events[1]
+    assert attempt['args'] == {
+        'attempt' : 1, 'outcome' : 'commit', 'instances' : 2, 'reads' : 2, 'writes' : 2,
+    }
+    assert all(event['dur'] >= 0 for event in events if event['ph'] == 'X')
+    assert events[0]['ph'] == 'M'
+
+
+def test_tracer_records_retries():
+    i = m.Int()
+    def fun(instance_list, read_list):
+        if not calls:
+            calls.append(1)
+            thread = threading.Thread(target=i.__iadd__, args=(1, ))
+            thread.start()
+            thread.join()
+        yield i, read_list[0] + 10
+    calls = []
+    with Tracer() as tracer:
+        Action().transaction(i, write_action=fun)
+    outcomes = [
+        event['args']['outcome'] for event in tracer.events()
+        if event['name'] == 'attempt' and event['tid'] == threading.get_ident()
+    ]
+    assert outcomes == ['abort', 'commit']
+    assert i == 11
+
+
+def test_tracer_sampling_and_buffer():
+    i = m.Int()
+    with Tracer(sample_rate=0) as tracer:
+        m.transfer_value(i, m.Int(), 1)
+    assert phases(tracer.events()) == []
+    with Tracer(buffer_size=6) as tracer:
+        for _ in range(3):
+            m.transfer_value(i, m.Int(), 1)
+    assert phases(tracer.events()) == ['attempt', 'read', 'write', 'lock', 'validate', 'commit']
+    tracer.clear()
+    assert phases(tracer.events()) == []
+
+
+def test_tracer_run_and_export():
+    @m.transactional
+    class Point:
+        x: int = 0
+    point = Point()
+    @m.atomically
+    def move():
+        point.x += 1
+    with Tracer() as tracer:
+        move()
+    fileobj = io.StringIO()
+    tracer.dump(fileobj)
+    trace = json.loads(fileobj.getvalue())
+    assert phases(trace['traceEvents']) == ['attempt', 'write', 'lock', 'validate', 'commit']
+
+
+def test_tracer_records_single_object_updates():
+    i, l = m.Int(), m.List()
+    with Tracer() as tracer:
+        i += 1
+        l.append(1)
+        Action().commute(i, l, write_action=lambda instance_list, read_list: ())
+    events = tracer.events()
+    assert phases(events) == ['attempt', 'lock', 'write', 'commit'] * 3
+    attempts = [event['args'] for event in events if event['name'] == 'attempt']
+    assert attempts[0] == {
+        'attempt' : 1, 'outcome' : 'commit', 'instances' : 1, 'reads' : 1, 'writes' : 1,
+    }
+    assert attempts[2]['instances'] == 2 and attempts[2]['reads'] == 0
@@ -1,5 +1,10 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
-from tram.objects import (Dict, Float, Int, List)
+from tram.objects import (Dict, Float, Int, List, PriorityQueue, Set, SortedDict, SortedList,
+                          checkpoint)
 from tram.functions import (transfer_value, transfer_item)
+from tram.journal import (Journal, recover)
+from tram.executor import (Executor, Task)
+from tram.fields import (atomically, transactional)
+from tram.cache import (Cache, memoize)
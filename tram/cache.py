@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Bounded transactional caches and memoization
+
+A Cache stores its entries in a PersistentMap, so inserting or evicting a
+key commits an O(log n) update instead of copying the whole mapping. The
+bookkeeping used to pick eviction victims (last access and hit count) is
+kept outside of the transactional data and updated without locks: it only
+has to be roughly right, and this way a hit never writes to the cache.
+
+Eviction samples the oldest few keys in insertion order and drops the
+worst of them by the cache's policy, sending the others to the back of
+the line, rather than keeping an exact ordering of every entry. The
+bookkeeping for a write is only updated once it commits, so that retries
+and rollbacks of an enclosing transaction don't count twice.
+"""
+
+from concurrent.futures import Future
+from itertools import islice
+import threading
+import time
+
+from tram.objects import Action, HasTram
+from tram.persistent import PersistentMap
+
+POLICIES = ('lru', 'lfu', 'ttl')
+SAMPLE = 5 # eviction candidates considered per insert
+
+_missing = object()
+_kwargs = object() # separates args from kwargs in memoize keys
+
+
+class Cache(HasTram):
+    """Mapping which holds at most maxsize entries
+
+    policy chooses which entry to evict once the cache is full:
+        'lru' -- the least recently used
+        'lfu' -- the least frequently used
+        'ttl' -- the soonest to expire
+    Entries which have expired are always evicted first. If ttl is given,
+    entries expire that many seconds after they are set.
+    """
+
+    def __init__(self, maxsize=128, policy='lru', ttl=None):
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of {}, not {!r}".format(POLICIES, policy))
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1, not {!r}".format(maxsize))
+        super().__init__()
+        self.maxsize = maxsize
+        self.policy = policy
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._meta = {} # key : [last access, hit count], in insertion order
+        self._meta_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, dict(
+            (key, value) for key, (value, __) in self.data.items()
+        ))
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return self._lookup(key, count=False) is not _missing
+
+    def __getitem__(self, key):
+        value = self._lookup(key)
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        for name in ('_meta_lock', '_flights', '_flights_lock'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        # not shared with the original by copy.copy
+        self._meta = dict((key, list(meta)) for key, meta in self._meta.items())
+        self._meta_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def __delitem__(self, key):
+        def fun(data):
+            return data.delete(key)
+        Action.apply(self, fun)
+        Action.defer(lambda: self._forget(key))
+
+    @staticmethod
+    def _coerce(item):
+        return item if isinstance(item, PersistentMap) else PersistentMap(item or ())
+
+    def copy(self):
+        result = self.__class__(self.maxsize, self.policy, self.ttl)
+        result.data = self.data
+        return result
+
+    def clear(self):
+        def fun(data):
+            return PersistentMap()
+        Action.apply(self, fun)
+        Action.defer(self._forget_all)
+
+    def get(self, key, default=None):
+        value = self._lookup(key)
+        return default if value is _missing else value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting another entry if the cache is full
+
+        ttl overrides the cache's ttl for this entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        evicted, sampled = [], set()
+        def fun(data):
+            # only choose victims here: this may run again, or be rolled back
+            data = data.set(key, (value, expires))
+            del evicted[:]
+            sampled.clear()
+            with self._meta_lock:
+                while len(data) > self.maxsize:
+                    victim = self._victim(data, key, evicted, sampled)
+                    evicted.append(victim)
+                    data = data.discard(victim)
+            return data
+        Action.apply(self, fun)
+        Action.defer(lambda: self._settle(key, evicted, sampled))
+
+    def get_or_compute(self, key, function):
+        """Return the value for key, calling function() to fill it on a miss
+
+        When several threads miss on the same key at once, only one of them
+        calls function and the others wait for its result, or its exception.
+        """
+        value = self._lookup(key)
+        if value is not _missing:
+            return value
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Future()
+        if not leader:
+            return flight.result()
+        try:
+            # somebody may have filled the key just before we took the lead
+            value = self._lookup(key, count=False)
+            if value is _missing:
+                value = function()
+                self.set(key, value)
+        except BaseException as error:
+            flight.set_exception(error)
+            raise
+        else:
+            flight.set_result(value)
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+        return value
+
+    def _lookup(self, key, count=True):
+        """Return the live value for key or _missing, noting the access"""
+        value, expires = self.data.get(key, (_missing, None))
+        if value is not _missing and expires is not None and expires <= time.monotonic():
+            value = _missing
+        if not count:
+            return value
+        if value is _missing:
+            self.misses += 1
+            return value
+        self.hits += 1
+        meta = self._meta.get(key)
+        if meta is not None:
+            meta[0] = time.monotonic()
+            meta[1] += 1
+        return value
+
+    def _forget(self, key):
+        with self._meta_lock:
+            self._meta.pop(key, None)
+
+    def _forget_all(self):
+        with self._meta_lock:
+            self._meta.clear()
+
+    def _victim(self, data, keep, evicted, sampled):
+        """Pick a key of data to evict, other than keep or those evicted
+
+        Holds _meta_lock and changes nothing: the keys considered are added
+        to sampled, for _settle to send to the back of the line.
+        """
+        now = time.monotonic()
+        candidates = []
+        for key in self._meta:
+            if len(candidates) == SAMPLE:
+                break
+            if key == keep or key in evicted:
+                continue
+            entry = data.get(key, _missing)
+            if entry is _missing:
+                continue # deleted by somebody else
+            __, expires = entry
+            if expires is not None and expires <= now:
+                return key
+            candidates.append((self._score(key, expires), key))
+        if not candidates:
+            # metadata lost track of entries, fall back to any key
+            return next(key for key in data if key != keep and key not in evicted)
+        __, victim = min(candidates, key=lambda pair: pair[0])
+        sampled.update(key for __, key in candidates)
+        return victim
+
+    def _settle(self, key, evicted, sampled):
+        """Update the bookkeeping once a set of key has committed"""
+        data = self._state[0]
+        with self._meta_lock:
+            if key not in self._meta:
+                self._meta[key] = [time.monotonic(), 0]
+            for victim in evicted:
+                self._meta.pop(victim, None)
+            self.evictions += len(evicted)
+            for other in sampled:
+                if other in self._meta and other not in evicted:
+                    self._meta[other] = self._meta.pop(other)
+            # drop the metadata of keys which somebody else deleted
+            for other in list(islice(self._meta, SAMPLE)):
+                if other not in data:
+                    del self._meta[other]
+
+    def _score(self, key, expires):
+        last, hits = self._meta[key]
+        if self.policy == 'lru':
+            return (last, )
+        if self.policy == 'lfu':
+            return (hits, last)
+        return (float('inf') if expires is None else expires, last)
+
+
+def memoize(function=None, maxsize=128, policy='lru', ttl=None):
+    """Decorator caching results by arguments in a Cache
+
+    Use bare or with Cache arguments. Arguments must be hashable, and the
+    cache is available as the `cache` attribute of the decorated function.
+    """
+    def decorate(function):
+        cache = Cache(maxsize, policy, ttl)
+        def new_function(*args, **kwargs):
+            key = args
+            if kwargs:
+                key += (_kwargs, ) + tuple(sorted(kwargs.items()))
+            return cache.get_or_compute(key, lambda: function(*args, **kwargs))
+        new_function.__name__ = function.__name__
+        new_function.__doc__ = function.__doc__
+        new_function.cache = cache
+        return new_function
+    if function is not None:
+        return decorate(function)
+    return decorate
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Run batches of transactions without aborting on each other
+
+Each task in a batch touches a set of tram instances, either declared or
+observed from the tram objects among its arguments. A task only starts
+once the earlier tasks of the batch which touch the same instances have
+finished, and otherwise runs concurrently on a thread pool. Transactions
+in a batch therefore never conflict with each other, only with commits
+from outside the batch, and tasks sharing an instance apply in order.
+"""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+import os
+import threading
+import time
+
+from tram.objects import HasTram
+
+
+class Task:
+    """A call to run as part of a batch
+
+    instances lists every tram object the call may read or write. If it is
+    None, it is taken to be the tram objects among args and kwargs,
+    including those inside list, tuple, set or dict arguments.
+    """
+
+    def __init__(self, function, *args, instances=None, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        if instances is None:
+            instances = observe(args + tuple(kwargs.values()))
+        self.instances = list(instances)
+
+    def __call__(self):
+        return self.function(*self.args, **self.kwargs)
+
+
+def observe(values):
+    """Return the tram instances among values and their direct contents"""
+    result = []
+    for value in values:
+        if isinstance(value, HasTram):
+            result.append(value)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            result.extend(item for item in value if isinstance(item, HasTram))
+        elif isinstance(value, dict):
+            result.extend(item for item in value.values() if isinstance(item, HasTram))
+    return result
+
+
+def dependencies(tasks):
+    """Return, for each task, the earlier tasks it has to wait for
+
+    A task waits for the most recent earlier task touching each of its
+    instances, so tasks sharing an instance run in submission order while
+    everything else is free to run concurrently.
+    """
+    last = {}
+    result = []
+    for n, task in enumerate(tasks):
+        waits = set()
+        for instance in task.instances:
+            previous = last.get(id(instance))
+            if previous is not None:
+                waits.add(previous)
+            last[id(instance)] = n
+        result.append(sorted(waits))
+    return result
+
+
+class Batch:
+    """Futures and throughput of one submitted batch
+
+    conflicts counts the pairs of tasks which were ordered because they
+    share an instance, and depth is the length of the longest such chain.
+    """
+
+    def __init__(self, tasks, waits):
+        self.tasks = tasks
+        self.futures = [Future() for _ in tasks]
+        self.conflicts = sum(map(len, waits))
+        depth = []
+        for before in waits:
+            depth.append(1 + max((depth[n] for n in before), default=0))
+        self.depth = max(depth, default=0)
+        self.started = time.perf_counter()
+        self.finished = None
+        self._waiting = list(map(len, waits))
+        self._dependents = [[] for _ in tasks]
+        for n, before in enumerate(waits):
+            for other in before:
+                self._dependents[other].append(n)
+        self._pending = len(tasks)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not tasks:
+            self._finish()
+
+    def __len__(self):
+        return len(self.futures)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for every task; return their results in submission order
+
+        Raises the first exception raised by a task, in submission order.
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError
+        return [future.result() for future in self.futures]
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def throughput(self):
+        """Tasks completed per second"""
+        with self._lock:
+            completed = len(self.futures) - self._pending
+        elapsed = self.elapsed
+        return completed / elapsed if elapsed else 0.0
+
+    def ready(self):
+        return [n for n, count in enumerate(self._waiting) if not count]
+
+    def run(self, n):
+        """Run task n; return the tasks it was the last to hold up"""
+        future = self.futures[n]
+        if future.set_running_or_notify_cancel():
+            try:
+                result = self.tasks[n]()
+            except BaseException as error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        released = []
+        with self._lock:
+            for other in self._dependents[n]:
+                self._waiting[other] -= 1
+                if not self._waiting[other]:
+                    released.append(other)
+            self._pending -= 1
+            finished = not self._pending
+        if finished:
+            self._finish()
+        return released
+
+    def _finish(self):
+        self.finished = time.perf_counter()
+        self._done.set()
+
+
+class Executor:
+    """Thread pool which runs conflicting transactions of a batch serially"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._pool = ThreadPoolExecutor(self.max_workers)
+        self._batches = set() # submitted and not yet done
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    def shutdown(self, wait=True):
+        """Stop accepting batches; if wait, let submitted batches finish first
+
+        Without wait, tasks freed after shutdown run on the threads which
+        freed them.
+        """
+        if wait:
+            with self._lock:
+                batches = list(self._batches)
+            for batch in batches:
+                batch._done.wait() # without raising what its tasks raised
+        self._pool.shutdown(wait=wait)
+
+    def submit(self, tasks):
+        """Schedule a batch of Tasks, or (function, *args) tuples
+
+        Returns a Batch holding one future per task.
+        """
+        tasks = [task if isinstance(task, Task) else Task(*task) for task in tasks]
+        batch = Batch(tasks, dependencies(tasks))
+        if tasks:
+            with self._lock:
+                self._batches.add(batch)
+        for n in batch.ready():
+            self._pool.submit(self._run, batch, n)
+        return batch
+
+    def run(self, tasks):
+        """Run a batch of tasks and return their results"""
+        return self.submit(tasks).wait()
+
+    def _run(self, batch, n):
+        # keep running down one chain of released tasks on this thread
+        pending = [n]
+        while pending:
+            released = batch.run(pending.pop())
+            if released:
+                pending.append(released.pop())
+            for other in released:
+                try:
+                    self._pool.submit(self._run, batch, other)
+                except RuntimeError: # the pool has been shut down
+                    pending.append(other)
+        if batch.done():
+            with self._lock:
+                self._batches.discard(batch)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Change notifications for tram objects
+
+Every successful commit publishes one ChangeEvent per written instance to
+that instance's subscriptions, after the committing thread has released
+its locks. Each subscription buffers events in a bounded queue and drops
+them when the queue is full, so a slow consumer never stalls a commit.
+Deltas are computed on the consuming side, only when an event is taken.
+"""
+
+from collections import namedtuple
+import queue
+import threading
+
+from tram.objects import Action, CommitHook, Dict, List, Number
+
+ChangeEvent = namedtuple('ChangeEvent', 'instance old_version version delta'.split())
+DictDelta = namedtuple('DictDelta', 'set deleted'.split())
+ListDelta = namedtuple('ListDelta', 'start old_stop new_stop'.split())
+
+_lock = threading.Lock()
+_closed = object()
+
+
+def delta(instance, old, new):
+    """Describe the difference between two committed values of instance
+
+    Dicts yield the keys whose values were replaced or added and the keys
+    which were deleted. Lists yield the index range which differs: items
+    old[start:old_stop] were replaced by new[start:new_stop]. Numbers yield
+    their difference. Anything else yields None.
+    """
+    if isinstance(instance, Dict):
+        return DictDelta(
+            {key for key, value in new.items() if key not in old or old[key] is not value},
+            set(old.keys() - new.keys()),
+        )
+    if isinstance(instance, List):
+        start = 0
+        limit = min(len(old), len(new))
+        while start < limit and old[start] is new[start]:
+            start += 1
+        old_stop, new_stop = len(old), len(new)
+        while old_stop > start and new_stop > start and old[old_stop - 1] is new[new_stop - 1]:
+            old_stop -= 1
+            new_stop -= 1
+        return ListDelta(start, old_stop, new_stop)
+    if isinstance(instance, Number):
+        return new - old
+    return None
+
+
+class Subscription:
+    """Bounded stream of ChangeEvents for one instance
+
+    With a callback, events are delivered on a daemon thread; otherwise the
+    subscription is iterated directly. Events which arrive while the queue
+    is full are counted in `dropped` rather than delivered.
+    """
+
+    def __init__(self, instance, callback=None, maxsize=1024):
+        self.instance = instance
+        self.callback = callback
+        self.dropped = 0
+        self._lock = threading.Lock() # guards dropped
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        if callback is not None:
+            self._thread = threading.Thread(target=self._deliver, daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        event = self.get()
+        if event is None:
+            raise StopIteration
+        return event
+
+    def get(self, timeout=None):
+        """Wait for the next event; returns None once closed
+
+        Raises queue.Empty if timeout passes without an event.
+        """
+        item = self._queue.get(timeout=timeout)
+        if item is _closed:
+            self._queue.put(_closed)
+            return None
+        instance, old, new, old_version, version = item
+        return ChangeEvent(instance, old_version, version, delta(instance, old, new))
+
+    def publish(self, change):
+        try:
+            self._queue.put_nowait(change)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def close(self):
+        """Stop receiving events and end iteration"""
+        unsubscribe(self.instance, self)
+        while True:
+            try:
+                self._queue.put_nowait(_closed)
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    with self._lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _deliver(self):
+        for event in self:
+            self.callback(event)
+
+
+class Feed(CommitHook):
+    """Commit hook which fans changes out to subscriptions"""
+
+    def after_commit(self, changes):
+        merged = {}
+        for change in changes:
+            if not change.instance._subscribers:
+                continue
+            first = merged.get(id(change.instance))
+            if first is not None:
+                change = change._replace(old=first.old, old_version=first.old_version)
+            merged[id(change.instance)] = change
+        for change in merged.values():
+            for subscription in change.instance._subscribers:
+                subscription.publish(change)
+
+
+FEED = Feed()
+
+
+def subscribe(instance, callback=None, maxsize=1024):
+    """Return a new Subscription to commits on instance"""
+    subscription = Subscription(instance, callback, maxsize)
+    attach(instance, subscription)
+    return subscription
+
+
+def attach(instance, subscriber):
+    """Call subscriber.publish(change) after every commit to instance
+
+    publish runs on the committing thread and must not block.
+    """
+    with _lock:
+        instance._subscribers = instance._subscribers + (subscriber, )
+        if FEED not in Action.hooks:
+            Action.hooks.append(FEED)
+
+
+def unsubscribe(instance, subscription):
+    with _lock:
+        instance._subscribers = tuple(
+            other for other in instance._subscribers if other is not subscription
+        )
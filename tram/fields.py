@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Classes whose attributes are individually transactional
+
+@transactional turns the annotated attributes of a class into Fields,
+each backed by its own versioned Cell held in a slot. Within a
+transaction, reading a field is logged against that field alone and
+writing one locks only that field at commit, so transactions touching
+different fields of the same instance never conflict. Outside of a
+transaction each read or write of a field is atomic on its own.
+
+    @transactional
+    class Account:
+        balance: int = 0
+        owner: str = ''
+
+    @atomically
+    def deposit(account, amount):
+        account.balance += amount
+"""
+
+import threading
+
+from tram.objects import Action
+
+
+class Cell:
+    """Versioned value of one field of one instance"""
+
+    __slots__ = ('_lock', '_state')
+
+    _subscribers = ()
+
+    def __init__(self, data=None):
+        self._lock = threading.Lock()
+        self._state = (data, 0) # never committed
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.data)
+
+    def __enter__(self):
+        self._lock.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._lock.release()
+
+    def __getstate__(self):
+        return self._state
+
+    def __setstate__(self, state):
+        self._lock = threading.Lock()
+        self._state = state
+
+    @property
+    def _locked(self):
+        return self._lock.locked()
+
+    @property
+    def data(self):
+        return self._state[0]
+
+    @property
+    def version(self):
+        return self._state[1]
+
+    def publish(self, data, version):
+        """Replace data and version in one step; the caller holds the lock"""
+        self._state = (data, version)
+
+
+class Field:
+    """Descriptor for a transactional attribute stored in a Cell"""
+
+    def __init__(self, name, default=None):
+        self.name = name
+        self.default = default
+        self.slot = None # member descriptor of the slot holding the Cell
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.name)
+
+    def cell(self, instance):
+        return self.slot.__get__(instance, type(instance))
+
+    def attach(self, instance, data):
+        self.slot.__set__(instance, Cell(data))
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cell = self.cell(instance)
+        action = Action.current()
+        if action is None:
+            return cell.data
+        return action.read_unlocked(cell)
+
+    def __set__(self, instance, value):
+        cell = self.cell(instance)
+        action = Action.current()
+        if action is None:
+            Action.apply(cell, lambda data: value)
+        else:
+            action.include((cell, ))
+            action.write(((cell, value), ))
+
+
+def transactional(cls):
+    """Class decorator making every annotated attribute a Field
+
+    The class is rebuilt with __slots__, so its instances carry one Cell
+    per field and no __dict__ unless a base class provides one. Class
+    attributes give field defaults; without them, fields start as None.
+    If the class doesn't define __init__, it accepts field values as
+    keyword arguments.
+    """
+    names = list(cls.__dict__.get('__annotations__', {}))
+    fields = [Field(name, cls.__dict__.get(name)) for name in names]
+    extra = cls.__dict__.get('__slots__', ())
+    if isinstance(extra, str):
+        extra = (extra, )
+    namespace = {
+        key : value for key, value in cls.__dict__.items()
+        if key not in names and key not in extra and key not in ('__dict__', '__weakref__')
+    }
+    namespace['__slots__'] = tuple(extra) + tuple('_cell_' + name for name in names)
+    namespace['_fields'] = tuple(names)
+    init = namespace.get('__init__')
+
+    def __init__(self, *args, **kwargs):
+        if init is None and args:
+            raise TypeError("{}() takes only keyword arguments".format(cls.__name__))
+        for field in fields:
+            field.attach(self, field.default if init else kwargs.pop(field.name, field.default))
+        if init is not None:
+            init(self, *args, **kwargs)
+        elif kwargs:
+            raise TypeError("{}() got unexpected fields {}".format(cls.__name__, sorted(kwargs)))
+
+    def __repr__(self):
+        return "{}({})".format(cls.__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name)) for name in names
+        ))
+
+    namespace['__init__'] = __init__
+    namespace.setdefault('__repr__', __repr__)
+    new = type(cls)(cls.__name__, cls.__bases__, namespace)
+    for field in fields:
+        field.slot = new.__dict__['_cell_' + field.name]
+        setattr(new, field.name, field)
+    for member in cls.__dict__.values():
+        rebind(member, cls, new)
+    return new
+
+
+def rebind(member, old, new):
+    """Point the __class__ cell of a method at new, for zero-argument super()"""
+    if isinstance(member, (classmethod, staticmethod)):
+        member = member.__func__
+    elif isinstance(member, property):
+        for function in (member.fget, member.fset, member.fdel):
+            rebind(function, old, new)
+        return
+    closure = getattr(member, '__closure__', None) or ()
+    names = getattr(getattr(member, '__code__', None), 'co_freevars', ())
+    for name, cell in zip(names, closure):
+        if name == '__class__' and cell.cell_contents is old:
+            cell.cell_contents = new
+
+
+def atomically(function):
+    """Decorator running function as a transaction with Action.run
+
+    Fields and tram objects used by function join the transaction as they
+    are touched, and the whole call retries if any of them conflict.
+    """
+    def new_function(*args, **kwargs):
+        return Action().run(function, *args, **kwargs)
+    new_function.__name__ = function.__name__
+    new_function.__doc__ = function.__doc__
+    return new_function
@@ -23,6 +23,7 @@ def transfer_item(from_instance, to_instance, index):
     """
     def fun(instance_list, read_list):
         for instance, value in zip(instance_list, read_list):
+            value = value.copy() # committed data is shared, so never mutate it
             if instance is from_instance:
                 result = value.pop(index)
                 yield instance, value
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Write-ahead logging and checkpointing for tram objects
+
+A Journal is attached to Action.hooks and appends the changes of every
+commit which touches a tracked object to a log file. Every so often the
+state of all tracked objects is written to a snapshot and the log is
+truncated. recover() rebuilds the objects from the snapshot and the log.
+"""
+
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+from tram.objects import (CLOCK, Action, CommitHook, Dict, Float, Int, List, PriorityQueue,
+                          Set, SortedDict, SortedList)
+
+LOG_NAME = 'wal.log'
+SNAPSHOT_NAME = 'snapshot'
+HEADER = struct.Struct('>II') # payload length, crc32
+
+TYPES = {
+    cls.__name__ : cls
+    for cls in (Dict, Float, Int, List, PriorityQueue, Set, SortedDict, SortedList)
+}
+
+FSYNC_POLICIES = ('always', 'group', 'interval')
+
+
+class JournalError(Exception):
+    """Raised when a commit can't be logged durably"""
+    pass
+
+
+def make_frame(payload):
+    """Return payload as a length-prefixed, checksummed frame"""
+    blob = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    return HEADER.pack(len(blob), zlib.crc32(blob)) + blob
+
+
+def write_frame(fileobj, payload):
+    """Write a length-prefixed, checksummed frame to fileobj"""
+    fileobj.write(make_frame(payload))
+
+
+def read_frames(fileobj):
+    """Yield frame payloads until the end of the file or a torn frame"""
+    while True:
+        header = fileobj.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return
+        length, crc = HEADER.unpack(header)
+        blob = fileobj.read(length)
+        if len(blob) < length or zlib.crc32(blob) != crc:
+            return
+        yield pickle.loads(blob)
+
+
+def dump_instance(instance):
+    return (type(instance).__name__, ) + instance._state
+
+
+def load_instance(typename, data, version):
+    instance = TYPES[typename]()
+    CLOCK.advance(version)
+    instance.publish(data, version)
+    return instance
+
+
+class Journal(CommitHook):
+    """Durable log of commits to a set of named tram objects
+
+    fsync may be one of:
+        'always'   -- fsync inside every commit, before locks are released
+        'group'    -- commits wait after releasing their locks, and one
+                      waiter fsyncs on behalf of everybody who is queued
+        'interval' -- a background thread fsyncs every `interval` seconds,
+                      so the most recent commits may be lost on power failure
+
+    Opening a journal writes a fresh snapshot of the tracked objects,
+    replacing whatever was stored at path before.
+
+    Commits whose data can't be pickled are refused before they are
+    published. If writing the log fails, the commit that hit the error
+    raises JournalError once every hook has seen it, and the journal
+    refuses every later commit to a tracked object, since memory and log
+    no longer agree; `error` holds the original exception.
+    """
+
+    def __init__(self, path, objects=None, fsync='group', interval=0.01,
+                 checkpoint_every=1000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("fsync must be one of {}, not {!r}".format(FSYNC_POLICIES, fsync))
+        self.path = path
+        self.fsync = fsync
+        self.interval = interval
+        self.checkpoint_every = checkpoint_every
+        self.objects = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        self._sync = threading.Condition()
+        self._local = threading.local()
+        self._written = 0
+        self._synced = 0
+        self._syncing = False
+        self._since_checkpoint = 0
+        self._log = None
+        self._flusher = None
+        self.error = None
+        for name, instance in (objects or {}).items():
+            self.track(name, instance)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def track(self, name, instance):
+        """Start logging commits to instance under name"""
+        if type(instance).__name__ not in TYPES:
+            raise TypeError("can't journal instances of type {}".format(type(instance).__name__))
+        with self._lock:
+            if name in self.objects:
+                del self._names[id(self.objects[name])]
+            self.objects[name] = instance
+            self._names[id(instance)] = name
+
+    def open(self):
+        """Write an initial snapshot and start observing commits"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            self._checkpoint()
+        Action.hooks.append(self)
+        if self.fsync == 'interval':
+            self._stopped = threading.Event()
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+
+    def close(self):
+        """Stop observing commits and make the log durable"""
+        if self in Action.hooks:
+            Action.hooks.remove(self)
+        if self._flusher is not None:
+            self._stopped.set()
+            self._flusher.join()
+            self._flusher = None
+        with self._lock:
+            if self._log is not None:
+                if self.error is None:
+                    self._fsync()
+                self._log.close()
+                self._log = None
+
+    def checkpoint(self):
+        """Snapshot all tracked objects and truncate the log"""
+        with self._lock:
+            self._checkpoint()
+
+    def before_commit(self, changes):
+        # pickle the frame before anything is published, so that a value
+        # which can't be logged fails the commit instead of going missing
+        self._local.frame = None
+        entries = {}
+        for change in changes:
+            name = self._names.get(id(change.instance))
+            if name is not None:
+                entries[name] = (name, type(change.instance).__name__, change.value, change.version)
+        if not entries:
+            return
+        if self.error is not None:
+            raise JournalError("journal at {!r} has failed".format(self.path)) from self.error
+        self._local.frame = make_frame(list(entries.values()))
+
+    def on_commit(self, changes):
+        frame, self._local.frame = getattr(self._local, 'frame', None), None
+        if frame is None:
+            return
+        with self._lock:
+            if self._log is None:
+                return
+            try:
+                self._log.write(frame)
+                self._log.flush()
+                self._written += 1
+                self._local.lsn = self._written
+                if self.fsync == 'always':
+                    self._fsync()
+                self._since_checkpoint += 1
+                if self._since_checkpoint >= self.checkpoint_every:
+                    self._checkpoint()
+            except OSError as error:
+                self.error = error
+                raise JournalError(
+                    "commit was published but not logged to {!r}".format(self.path)
+                ) from error
+
+    def after_commit(self, changes):
+        lsn = getattr(self._local, 'lsn', 0)
+        self._local.lsn = 0
+        if self.fsync != 'group' or not lsn:
+            return
+        with self._sync:
+            while self._synced < lsn:
+                if self._syncing:
+                    self._sync.wait()
+                    continue
+                self._syncing = True
+                target = self._written
+                self._sync.release()
+                try:
+                    with self._lock:
+                        fd = os.dup(self._log.fileno()) if self._log else None
+                    if fd is not None:
+                        try:
+                            os.fsync(fd)
+                        finally:
+                            os.close(fd)
+                finally:
+                    self._sync.acquire()
+                    self._syncing = False
+                self._synced = max(self._synced, target)
+                self._sync.notify_all()
+
+    def _fsync(self):
+        os.fsync(self._log.fileno())
+        with self._sync:
+            self._synced = self._written
+            self._sync.notify_all()
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                if self._log is not None and self._synced < self._written:
+                    self._fsync()
+
+    def _checkpoint(self):
+        """Write snapshot and truncate the log; caller holds self._lock"""
+        snapshot = os.path.join(self.path, SNAPSHOT_NAME)
+        temporary = snapshot + '.tmp'
+        with open(temporary, 'wb') as fileobj:
+            write_frame(fileobj, {
+                name : dump_instance(instance)
+                for name, instance in self.objects.items()
+            })
+            fileobj.flush()
+            os.fsync(fileobj.fileno())
+        os.replace(temporary, snapshot)
+        if self._log is not None:
+            self._log.close()
+        self._log = open(os.path.join(self.path, LOG_NAME), 'wb')
+        fsync_directory(self.path)
+        self._since_checkpoint = 0
+        with self._sync:
+            self._synced = self._written
+            self._sync.notify_all()
+
+
+def fsync_directory(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def recover(path):
+    """Rebuild the objects stored by a Journal at path
+
+    Returns a dict of name : instance, which can be handed to a new Journal
+    to continue logging.
+    """
+    state = {}
+    try:
+        with open(os.path.join(path, SNAPSHOT_NAME), 'rb') as fileobj:
+            for snapshot in read_frames(fileobj):
+                state.update(snapshot)
+    except FileNotFoundError:
+        pass
+    try:
+        with open(os.path.join(path, LOG_NAME), 'rb') as fileobj:
+            for entries in read_frames(fileobj):
+                for name, typename, data, version in entries:
+                    # skip entries the snapshot, or a later entry, already covers
+                    if name not in state or version > state[name][2]:
+                        state[name] = (typename, data, version)
+    except FileNotFoundError:
+        pass
+    return {name : load_instance(*value) for name, value in state.items()}
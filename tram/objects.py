@@ -1,14 +1,28 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 
-from collections import namedtuple
+from collections import deque, namedtuple
+import functools
+import heapq
+import math
+from itertools import chain, repeat
+import queue
+import random
 import threading
 import time
 import sys
 
 from tram.decorators import atomic
+from tram.persistent import (PersistentHeap, PersistentSet, PersistentSortedList,
+                             PersistentSortedMap)
 
 Record = namedtuple('Record', 'instance value version'.split())
+Change = namedtuple('Change', 'instance old value old_version version'.split())
+
+class _Local(threading.local):
+    action = None # transaction running a write action on this thread
+
+_local = _Local()
 
 class ValidationError(Exception):
     """Raised when a log fails to validate"""
@@ -25,10 +39,96 @@ class MaxRetryError(Exception):
     pass
 
 
+class Clock:
+    """Global version clock
+
+    A logical counter: now() is the version of the latest commit, and every
+    tick() returns a version greater than anything now() returned before.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = 0
+
+    def now(self):
+        return self._last
+
+    def tick(self):
+        with self._lock:
+            self._last += 1
+            return self._last
+
+    def advance(self, version):
+        """Move the clock up to version, which was restored from elsewhere
+
+        Otherwise transactions reading an object restored with a version
+        ahead of the clock would abort until the clock caught up.
+        """
+        with self._lock:
+            self._last = max(self._last, math.ceil(version))
+
+
+CLOCK = Clock()
+
+
+def chunks(data, chunksize=None):
+    """Split a list into about 16 slices, or slices of chunksize items"""
+    if chunksize is None:
+        chunksize = -(-len(data) // 16) or 1
+    return [data[start:start + chunksize] for start in range(0, len(data), chunksize)]
+
+
+# bulk List operations hand these to executors, so they must be picklable
+
+def map_chunk(function, chunk):
+    return [function(item) for item in chunk]
+
+
+def filter_chunk(function, chunk):
+    return [item for item in chunk if function(item)]
+
+
+def sort_chunk(chunk, key, reverse):
+    return sorted(chunk, key=key, reverse=reverse)
+
+
+def reduce_chunk(function, chunk):
+    return functools.reduce(function, chunk)
+
+
+def checkpoint():
+    """Abort the transaction running on this thread if its reads are stale
+
+    Long write actions can call this periodically so that they restart as
+    soon as another thread commits a conflicting write, rather than when
+    they finally try to commit.
+    """
+    action = Action.current()
+    if action is not None:
+        action.validate()
+
+
+class Untraced:
+    """Stands in for a trace when a transaction isn't being traced"""
+
+    def begin(self, phase):
+        pass
+
+    def end(self, action, outcome):
+        pass
+
+
+UNTRACED = Untraced()
+
+
 class Action:
     """Object which implements TL2 algorithm
     """
 
+    hooks = [] # notified of every commit, see CommitHook
+    tracer = None # records the phases of each attempt, see tram.trace
+    scheduler = None # decides interleavings at scheduling points, see tram.replay
+
     def __init__(self, retries=100, sleep=0):
         self.retries = retries
         self.sleep = sleep
@@ -37,11 +137,24 @@ class Action:
         """initialize local logs"""
         self.read_log = []
         self.write_log = []
+        self.instance_list = []
+        self.unlocked = []
+        self.deferred = []
+        self.blocked = None
+        self.read_version = CLOCK.now()
 
     def __exit__(self, exc_type, exc_value, traceback):
         """send logs to the garbage collector"""
         del self.read_log
         del self.write_log
+        del self.instance_list
+        del self.unlocked
+        del self.deferred
+
+    @staticmethod
+    def current():
+        """Return the transaction running a write action on this thread, or None"""
+        return _local.action
 
     def decrement_retries(self):
         if self.retries <= 1:
@@ -49,12 +162,38 @@ class Action:
         else:
             self.retries -= 1
 
+    def pause(self, point):
+        """Scheduling point, one of 'read', 'lock', 'validate' or 'commit'
+
+        Each attempt passes these points just before reading, locking,
+        validating and committing. An installed scheduler may switch to
+        another thread here; otherwise the transaction sleeps for
+        self.sleep seconds, if that is set, to widen races in tests.
+        """
+        if self.scheduler is not None:
+            self.scheduler.pause(self, point)
+        elif self.sleep:
+            time.sleep(self.sleep)
+
     def validate(self):
         """Raise exception if any instance reads are no longer valid
         """
         for record in self.read_log:
             if record.instance.version > record.version:
                 raise ValidationError("Read log is stale")
+        for instance in self.unlocked:
+            if instance._locked and all(instance is not other for other in self.instance_list):
+                raise ValidationError("Read is being committed")
+
+    def read_unlocked(self, instance):
+        """Read instance without adding it to the set locked at commit
+
+        Validation then also fails if another transaction holds its lock,
+        since that transaction may be about to publish a newer version.
+        """
+        data, = self.read((instance, ))
+        self.unlocked.append(instance)
+        return data
 
     def read(self, instance_list):
         """Non-blocking read of attribute data"""
@@ -65,17 +204,38 @@ class Action:
                 __, data, version = next(filter(lambda x: x.instance is instance, reversed(self.write_log)))
             # If it doesn't exist, grab shared value
             except StopIteration:
-                data, version = instance.data, instance.version
+                # Abort if a commit may be publishing it, checking before the
+                # read so that we never see half of another commit
+                if instance._locked:
+                    self.blocked = instance
+                    raise ValidationError("Read is being committed")
+                data, version = instance._state
+                # Abort early if it changed since this attempt began
+                if version > self.read_version:
+                    raise ValidationError("Read is newer than transaction")
             self.read_log.append(Record(instance, data, version))
             result.append(data)
         return result
 
+    def wait_blocked(self):
+        """After aborting on a locked read, wait for its commit to finish
+
+        Call this while holding no locks, before the next attempt.
+        """
+        instance, self.blocked = self.blocked, None
+        if instance is None:
+            return
+        self.sequence_lock((instance, ))
+        self.sequence_unlock((instance, ))
+
     @staticmethod
     def sequence_lock(instance_list):
         """Lock all instances
 
         This method locks instances in order of their memory id to avoid deadlocking
         """
+        if Action.scheduler is not None:
+            return Action.scheduler.lock(instance_list)
         for instance in sorted(instance_list, key=id):
             instance.__enter__()
 
@@ -89,49 +249,393 @@ class Action:
             instance.__exit__(None, None, None)
 
     def transaction(self, *instance_list, write_action, read_action=None):
-        """Conduct threadsafe operation"""
+        """Conduct threadsafe operation
+
+        write_action receives the committed data of each instance, which is
+        shared with every reader and must never be mutated in place: build
+        and yield new values instead.
+
+        If another transaction is already running a write action on this
+        thread, this one joins it instead: see nest.
+        """
+        outer = self.current()
+        if outer is not None:
+            return outer.nest(instance_list, write_action)
         if read_action is None:
             read_action = self.read
+        def attempt(trace):
+            trace.begin('read')
+            self.include(instance_list)
+            read_list = read_action(instance_list)
+            trace.begin('write')
+            self.write(write_action(instance_list, read_list))
+        self.attempts(attempt)
+
+    def run(self, function, *args, **kwargs):
+        """Call function as a transaction and return its result
+
+        Unlike transaction, the instances involved needn't be known up
+        front: transactional fields (see tram.fields) and tram methods
+        called by function join this transaction as they are used, and
+        only the instances written to are locked at commit. function is
+        called again on conflict, so it should have no other side effects.
+        Inside another transaction, function simply runs as part of it.
+        """
+        if self.current() is not None:
+            return function(*args, **kwargs)
+        def attempt(trace):
+            trace.begin('write')
+            return function(*args, **kwargs)
+        # reads aren't locked, so two transactions which each read what the
+        # other writes can abort each other in lockstep
+        return self.attempts(attempt, backoff=True)
+
+    def attempts(self, attempt, backoff=False):
+        """Call attempt(trace) and commit what it logs, until one validates
+
+        The retry loop shared by transaction and run: attempt runs as this
+        transaction's write action and begins its own phases on trace, and
+        everything else about an attempt -- scheduling points, tracing,
+        locking, validation and commit -- happens here. With backoff, sleep
+        for a random, growing time after each abort. Returns what the
+        committed attempt returned.
+        """
         retries = self.retries
-        time.sleep(self.sleep) # these are here for testing in threaded envs
+        committed = []
+        deferred = []
+        delay = 1e-6
+        trace = self.tracer.start() if self.tracer is not None else None
+        trace = trace or UNTRACED
         while retries:
             with self:
-                read_list = read_action(instance_list)
-                self.write(write_action(instance_list, read_list))
-                self.sequence_lock(instance_list)
-                time.sleep(self.sleep) # for testing
                 try:
-                    self.validate()
-                    time.sleep(self.sleep) # for testing
-                    self.commit()
+                    self.pause('read')
+                    _local.action = self
+                    try:
+                        result = attempt(trace)
+                    finally:
+                        _local.action = None
+                    self.pause('lock')
+                    trace.begin('lock')
+                    self.sequence_lock(self.instance_list)
+                    try:
+                        self.pause('validate')
+                        trace.begin('validate')
+                        self.validate()
+                        self.pause('commit')
+                        trace.begin('commit')
+                        self.commit()
+                    finally:
+                        self.sequence_unlock(self.instance_list)
                 except ValidationError:
-                    pass
+                    trace.end(self, 'abort')
+                    self.wait_blocked()
+                    if backoff:
+                        time.sleep(random.random() * delay)
+                        delay = min(delay * 2, 1e-3)
                 except SuccessError:
+                    trace.end(self, 'commit')
+                    committed = self.changes
+                    deferred = self.deferred
                     break
-                finally:
-                    self.sequence_unlock(instance_list)
+                except BaseException:
+                    trace.end(self, 'error')
+                    raise
             self.decrement_retries()
+        for callback in deferred:
+            callback()
+        if committed:
+            self.finish_commit(committed)
+        return result
+
+    def include(self, instance_list):
+        """Add instances to the set locked and validated at commit"""
+        for instance in instance_list:
+            if all(instance is not other for other in self.instance_list):
+                self.instance_list.append(instance)
+
+    def savepoint(self):
+        """Mark the current end of the logs, for use with rollback"""
+        return len(self.write_log), len(self.deferred)
+
+    def rollback(self, savepoint):
+        """Discard writes logged and callbacks deferred since savepoint
+
+        Reads are kept, since whatever the caller does next may depend on
+        them, and so they must still be validated at commit.
+        """
+        writes, deferred = savepoint
+        del self.write_log[writes: ]
+        del self.deferred[deferred: ]
+
+    @staticmethod
+    def defer(callback):
+        """Call callback once the transaction running on this thread commits
+
+        Outside of a transaction, callback is called right away. Callbacks
+        are dropped when an attempt aborts or is rolled back, so use this
+        for side effects which must happen once, and only if the writes
+        they go with are committed.
+        """
+        action = Action.current()
+        if action is None:
+            callback()
+        else:
+            action.deferred.append(callback)
+
+    def nest(self, instance_list, write_action):
+        """Run a write action as part of this transaction
+
+        The nested action reads through this transaction's logs, so it sees
+        writes made earlier in the transaction, and its own writes are only
+        committed along with everything else. If it raises, its writes are
+        rolled back to a savepoint and the exception propagates, so that the
+        enclosing write action may recover without restarting.
+        """
+        savepoint = self.savepoint()
+        self.include(instance_list)
+        try:
+            read_list = self.read(instance_list)
+            self.write(write_action(instance_list, read_list))
+        except BaseException:
+            self.rollback(savepoint)
+            raise
+
+    @classmethod
+    def apply(cls, instance, function):
+        """Replace the data of a single instance with function(data)
+
+        The fast path for transactions over one object: the instance is
+        locked while function runs, so there is nothing to validate, and
+        no logs are kept. The commit still takes a version from the clock,
+        so concurrent multi-object transactions which read the instance
+        fail validation as usual. Inside another transaction, joins it.
+        An installed tracer sees one attempt, which locks, writes and commits.
+        """
+        outer = cls.current()
+        if outer is not None:
+            return outer.nest((instance, ), atomic(function))
+        trace = cls.tracer.start() if cls.tracer is not None else None
+        trace = trace or UNTRACED
+        trace.begin('lock')
+        if cls.scheduler is None:
+            instance.__enter__()
+        else:
+            cls.scheduler.lock((instance, ))
+        try:
+            trace.begin('write')
+            old, old_version = instance._state
+            value = function(old)
+            trace.begin('commit')
+            version = CLOCK.tick()
+            for hook in cls.hooks:
+                hook.before_commit([Change(instance, old, value, old_version, version)])
+            instance.publish(value, version)
+            changes = [Change(instance, old, instance._state[0], old_version, version)] if cls.hooks else []
+            error = notify(cls.hooks, 'on_commit', changes) if changes else None
+        except BaseException:
+            trace.end(cls.logged(instance), 'error')
+            raise
+        finally:
+            instance.__exit__(None, None, None)
+        if trace is not UNTRACED:
+            trace.end(cls.logged(instance, (old, old_version), (value, version)), 'commit')
+        if changes:
+            after_error = notify(cls.hooks, 'after_commit', changes)
+            error = error or after_error
+            if error is not None:
+                raise error
+
+    @classmethod
+    def logged(cls, instance, read=None, written=None):
+        """Return an action holding the logs apply would have kept, for tracers
+
+        read and written are (data, version) pairs, if they are known.
+        """
+        action = cls()
+        action.__enter__()
+        action.instance_list.append(instance)
+        if read is not None:
+            action.read_log.append(Record(instance, *read))
+        if written is not None:
+            action.write_log.append(Record(instance, *written))
+        return action
+
+    def commute(self, *instance_list, write_action):
+        """Apply a write action to instances while they are locked
+
+        Nothing is added to the read log, so the transaction can't fail
+        validation: use this only for updates which commute with every other
+        write to the instances, such as adding to a counter. The write action
+        must not touch any other tram objects.
+        """
+        outer = self.current()
+        if outer is not None:
+            return outer.nest(instance_list, write_action)
+        committed = []
+        trace = self.tracer.start() if self.tracer is not None else None
+        trace = trace or UNTRACED
+        with self:
+            self.include(instance_list)
+            trace.begin('lock')
+            self.sequence_lock(self.instance_list)
+            try:
+                trace.begin('write')
+                read_list = [instance._state[0] for instance in instance_list]
+                self.write(write_action(instance_list, read_list))
+                trace.begin('commit')
+                self.commit()
+            except SuccessError:
+                trace.end(self, 'commit')
+                committed = self.changes
+            except BaseException:
+                trace.end(self, 'error')
+                raise
+            finally:
+                self.sequence_unlock(self.instance_list)
+        if committed:
+            self.finish_commit(committed)
+
+    def finish_commit(self, changes):
+        """Notify hooks once locks are released, then raise what any hook raised"""
+        error = notify(self.hooks, 'after_commit', changes)
+        error = self.hook_error or error
+        if error is not None:
+            raise error
 
     def commit(self):
-        """Commit write log to memory"""
+        """Commit write log to memory
+
+        Hooks may refuse the commit from before_commit, before anything is
+        published. Errors raised by their on_commit are kept in hook_error
+        until after_commit, so that every hook still sees the commit.
+        """
+        changes = []
+        version = CLOCK.tick()
+        if self.hooks:
+            planned = [
+                Change(record.instance, record.instance._state[0], record.value,
+                       record.instance._state[1], version)
+                for record in self.write_log
+            ]
+            for hook in self.hooks:
+                hook.before_commit(planned)
         for record in self.write_log:
-            record.instance.data = record.value
-            record.instance.version = record.version
+            instance = record.instance
+            old, old_version = instance._state
+            instance.publish(record.value, version)
+            if self.hooks:
+                changes.append(Change(instance, old, instance._state[0], old_version, version))
+        self.changes = changes
+        self.hook_error = notify(self.hooks, 'on_commit', changes) if changes else None
         raise SuccessError
 
     def write(self, pair_list):
         """Write instance-value pairs to write log"""
         for instance, value in pair_list:
-            self.write_log.append(Record(instance, value, time.time()))
+            self.write_log.append(Record(instance, value, self.read_version))
+
+
+def notify(hooks, method, changes):
+    """Call method of every hook with changes; return the first error raised"""
+    error = None
+    for hook in hooks:
+        try:
+            getattr(hook, method)(changes)
+        except Exception as exc:
+            error = error or exc
+    return error
+
+
+class CommitHook:
+    """Base class for objects which observe commits
+
+    Append an instance to Action.hooks to receive a list of Change records
+    for every successful transaction which wrote to at least one instance.
+    """
+
+    def before_commit(self, changes):
+        """Called before changes are applied, while instances are locked
+
+        Raise to refuse the commit: nothing is published and the exception
+        propagates to the caller. Values in changes aren't coerced yet.
+        """
+        pass
+
+    def on_commit(self, changes):
+        """Called after changes are applied, while instances are still locked"""
+        pass
+
+    def after_commit(self, changes):
+        """Called once the committing thread has released its locks"""
+        pass
+
+
+class Combiner:
+    """Publication list which batches commutative updates to one instance
+
+    A thread which finds the combining lock free and nobody waiting makes
+    a plain single-object update. Otherwise it appends its update and then
+    waits for the lock. Whoever holds the lock applies every update
+    published so far through Action.apply, so a hot object takes one
+    commit per batch rather than one per update.
+    """
+
+    def __init__(self, instance):
+        self.instance = instance
+        self.pending = deque()
+        self.lock = threading.Lock()
+
+    def apply(self, function):
+        if not self.pending and not self.instance._locked:
+            Action.apply(self.instance, function)
+            return
+        request = [function, False, None] # function, done, error
+        self.pending.append(request)
+        with self.lock:
+            if not request[1]:
+                self.combine()
+        if request[2] is not None:
+            raise request[2]
+
+    def combine(self):
+        batch = []
+        def fun(value):
+            # take the batch once the instance is locked, so that it includes
+            # everything published while waiting for the previous commit
+            while self.pending:
+                batch.append(self.pending.popleft())
+            for request in batch:
+                try:
+                    value = request[0](value)
+                except Exception as error:
+                    request[2] = error
+            return value
+        try:
+            Action.apply(self.instance, fun)
+        except Exception as error:
+            for request in batch:
+                request[2] = error
+        finally:
+            for request in batch:
+                request[1] = True
 
 
 class HasTram:
-    """An Tobject with version and lock attributes"""
+    """An Tobject with version and lock attributes
+
+    Data and version are stored together in one immutable tuple, so that a
+    reader always sees a matching pair with a single attribute load, even
+    on free-threaded builds of Python.
+    """
+
+    _subscribers = ()
+    _combiner = None
 
     def __init__(self, data=None):
-        self.data = data
-        self._locked = False
-        self._version = time.time()
+        self._lock = threading.Lock()
+        # never committed, so as old as can be for any transaction reading it
+        self._state = (self._coerce(data), 0)
 
     def __repr__(self):
         return "{}({})".format(self.__class__.__name__, repr(self.data))
@@ -164,11 +668,9 @@ class HasTram:
         return self.__class__(self.data + self._cast(other))
 
     def __iadd__(self, other):
-        @atomic
         def fun(data, *args, **kwargs):
             return data + other
-        do = Action()
-        do.transaction(self, write_action=fun)
+        self.commute(fun)
         return self
 
     def __radd__(self, other):
@@ -178,11 +680,9 @@ class HasTram:
         return self.__class__(self.data * self._cast(other))
 
     def __imul__(self, other):
-        @atomic
         def fun(data, *args, **kwargs):
             return data * other
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
         return self
 
     def __rmul__(self, other):
@@ -197,48 +697,116 @@ class HasTram:
         return self.data[index]
 
     def __enter__(self):
-        wait_time = 1e-7
-        while self._locked:
-            time.sleep(wait_time)
-            wait_time *= 2
-        self._locked = True
+        self._lock.acquire()
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self._locked = False
+        self._lock.release()
+
+    def __getstate__(self):
+        """Pickle and copy data and version, but not the lock or subscribers"""
+        state = self.__dict__.copy()
+        del state['_lock']
+        state.pop('_subscribers', None)
+        state['_combiner'] = state.get('_combiner') is not None
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        combining = state.pop('_combiner', False)
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        if combining:
+            self.set_combining()
+
+    @property
+    def _locked(self):
+        return self._lock.locked()
 
     @property
     def version(self):
-        return self._version
+        return self._state[1]
 
     @version.setter
     def version(self, value):
         if value < self.version: # versions are clocks
             raise ValueError("Can't overwrite clock {} with older value: {}".format(self.version, value))
         else:
-            self._version = value
+            CLOCK.advance(value)
+            self._state = (self._state[0], value)
 
     @property
     def data(self):
-        return self._data
+        """Committed data, or as the transaction running on this thread sees it
+
+        Inside a transaction the read goes through its logs, so it includes
+        the transaction's own writes and is validated at commit.
+        """
+        action = Action.current()
+        if action is None:
+            return self._state[0]
+        return action.read_unlocked(self)
 
     @data.setter
     def data(self, item):
-        self._data = item
+        self._state = (self._coerce(item), self._state[1])
+
+    @property
+    def _data(self):
+        return self._state[0]
+
+    @staticmethod
+    def _coerce(item):
+        """Convert item to the type stored as data"""
+        return item
+
+    def publish(self, data, version):
+        """Replace data and version in one step; the caller holds the lock"""
+        self._state = (self._coerce(data), version)
 
     def clear(self):
         """Sets instance data to be cls()
 
         This is typically a falsey value, like 0 or []
         """
-        @atomic
         def fun(*args, **kwargs):
             return type(self.data)()
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
     def copy(self):
         return self.__class__(self.data)
 
+    def set_combining(self, enabled=True):
+        """Batch commutative updates from concurrent threads into one commit
+
+        Affects +=, -=, List.append and Dict.increment on this instance.
+        This only pays off when commits are expensive, as with a Journal
+        which fsyncs every commit: uncontended updates cost a little more.
+        """
+        self._combiner = Combiner(self) if enabled else None
+
+    def commute(self, function):
+        """Replace data with function(data), which must commute with other updates
+
+        Without combining this is a single-object update, see Action.apply.
+        With combining the update is batched with others and applied in one
+        commit. Inside another transaction it always joins it.
+        """
+        combiner = self._combiner
+        if combiner is not None and Action.current() is None:
+            combiner.apply(function)
+        else:
+            Action.apply(self, function)
+
+    def subscribe(self, callback=None, maxsize=1024):
+        """Receive a ChangeEvent after every commit to this instance
+
+        If callback is given it is called with each event on a separate
+        thread, otherwise iterate over the returned Subscription. At most
+        maxsize events are buffered; later ones are dropped and counted.
+        """
+        from tram.feed import subscribe
+        return subscribe(self, callback, maxsize)
+
 
 class Number(HasTram):
 
@@ -256,11 +824,9 @@ class Number(HasTram):
         return self.__class__(self.data - self._cast(other))
 
     def __isub__(self, other):
-        @atomic
         def fun(data):
             return data - other
-        do = Action()
-        do.transaction(self, write_action=fun)
+        self.commute(fun)
         return self
 
     def __rsub__(self, other):
@@ -270,11 +836,9 @@ class Number(HasTram):
         return Float(self.data / self._cast(other))
 
     def __itruediv__(self, other):
-        @atomic
         def fun(data):
             return data / other
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
         return self
 
     def __rtruediv__(self, other):
@@ -284,11 +848,9 @@ class Number(HasTram):
         return Int(self.data // self._cast(other))
 
     def __ifloordiv__(self, other):
-        @atomic
         def fun(data):
             return data // other
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
         return self
 
     def __rfloordiv__(self, other):
@@ -301,11 +863,9 @@ class Number(HasTram):
         return self.__class__(self.data ** self._cast(other))
 
     def __ipow__(self, other):
-        @atomic
         def fun(data):
             return data ** other
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
         return self
 
     def __rpow__(self, other):
@@ -336,7 +896,11 @@ class List(HasTram):
         return len(self.data)
 
     def __iter__(self):
-        return iter(self.data.copy())
+        """Iterate over a snapshot of the list, which is never mutated"""
+        return iter(self.data)
+
+    def __reversed__(self):
+        return reversed(self.data)
 
     def __add__(self, other):
         if isinstance(other, self.__class__):
@@ -354,29 +918,21 @@ class List(HasTram):
     __rmul__ = __mul__
 
     def __setitem__(self, index, item):
-        @atomic
         def fun(data, *args, **kwargs):
             return data[ :index] + [item] + data[index+1: ]
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
     def __delitem__(self, index):
-        @atomic
         def fun(data):
             return data[ :index] + data[index+1: ]
-        do = Action()
-        do.transaction(self, write_action=fun)
-
-    @property
-    def data(self):
-        return self._data
+        Action.apply(self, fun)
 
-    @data.setter
-    def data(self, item):
+    @staticmethod
+    def _coerce(item):
         if item:
-            self._data = list(item)
+            return list(item)
         else:
-            self._data = []
+            return []
 
     def append(self, item):
         self.__iadd__([item])
@@ -388,86 +944,120 @@ class List(HasTram):
         return self.data.count(item)
 
     def ifilter(self, function):
-        @atomic
-        def fun(data):
-            return filter(function, data)
-        do = Action()
-        do.transaction(self.data, write_action=fun)
+        self.filter_inplace(function)
 
     def imap(self, function, *args, **kwargs):
-        @atomic
-        def fun(data):
-            nonlocal args, kwargs
-            return function(data, *args, **kwargs)
+        self.map_inplace(lambda item: function(item, *args, **kwargs))
+
+    def _bulk(self, compute):
+        """Commit compute(data) over a snapshot, without locking while it runs
+
+        The new list is computed outside of any lock and committed once; if
+        another thread wrote to the list meanwhile, it is computed again.
+        """
+        def fun(instance_list, read_list):
+            yield self, compute(read_list[0])
         do = Action()
-        do.transaction(*self.data, write_action=fun)
+        do.transaction(self, write_action=fun)
+
+    def map_inplace(self, function, executor=None, chunksize=None):
+        """Replace each item with function(item) in one commit
+
+        With an executor from concurrent.futures, chunks of the list are
+        mapped in parallel, in which case function should be pure, and
+        picklable for a process pool.
+        """
+        def compute(data):
+            if executor is None:
+                return [function(item) for item in data]
+            return list(chain.from_iterable(
+                executor.map(map_chunk, repeat(function), chunks(data, chunksize))
+            ))
+        self._bulk(compute)
+
+    def filter_inplace(self, function, executor=None, chunksize=None):
+        """Keep only items for which function(item) is true, in one commit
+
+        executor works as for map_inplace.
+        """
+        def compute(data):
+            if executor is None:
+                return [item for item in data if function(item)]
+            return list(chain.from_iterable(
+                executor.map(filter_chunk, repeat(function), chunks(data, chunksize))
+            ))
+        self._bulk(compute)
+
+    def reduce(self, function, *initial, executor=None, chunksize=None):
+        """Fold the list with function, like functools.reduce
+
+        With an executor, chunks are reduced in parallel and their results
+        reduced in turn, so function must also be associative. Inside a
+        transaction, the list is read as part of it.
+        """
+        data = self.data
+        if executor is None or not data:
+            return functools.reduce(function, data, *initial)
+        partial = executor.map(reduce_chunk, repeat(function), chunks(data, chunksize))
+        return functools.reduce(function, partial, *initial)
 
     def index(self, item, *args):
         return self.data.index(item, *args)
 
     def insert(self, item, index):
-        @atomic
         def fun(data):
-            nonlocal index, item
-            if index < 0:
-                index = len(data) + index
-            return data[ :index] + [item] + data[index: ]
-        do = Action()
-        do.transaction(self, write_action=fun)
+            position = len(data) + index if index < 0 else index
+            return data[ :position] + [item] + data[position: ]
+        Action.apply(self, fun)
 
     def pop(self, index=-1):
         result = []
-        @atomic
         def fun(data, *args, **kwargs):
-            nonlocal index, result
-            if index < 0:
-                index = len(data) + index
-            result.append(data[index])
-            return data[ :index] + data[index+1: ]
-        do = Action()
-        do.transaction(self, write_action=fun)
+            position = len(data) + index if index < 0 else index
+            result[:] = [data[position]]
+            return data[ :position] + data[position+1: ]
+        Action.apply(self, fun)
         if len(result) == 1:
             return result[0]
         else:
             return result
 
     def remove(self, item):
-        @atomic
         def fun(data):
             nonlocal item
             index = data.index(item)
             return data[ :index] + data[index+1: ]
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
     def reverse(self, *args, **kwargs):
-        @atomic
         def fun(data):
             nonlocal args, kwargs
             return reversed(data, *args, **kwargs)
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
-    def sort(self, *args, **kwargs):
-        @atomic
-        def fun(data):
-            nonlocal args, kwargs
-            return sorted(data, *args, **kwargs)
-        do = Action()
-        do.transaction(self, write_action=fun)
+    def sort(self, key=None, reverse=False, executor=None, chunksize=None):
+        """Sort the list in one commit, stably
+
+        With an executor, chunks are sorted in parallel and then merged.
+        """
+        def compute(data):
+            if executor is None:
+                return sorted(data, key=key, reverse=reverse)
+            runs = executor.map(
+                sort_chunk, chunks(data, chunksize), repeat(key), repeat(reverse)
+            )
+            return list(heapq.merge(*runs, key=key, reverse=reverse))
+        self._bulk(compute)
 
 
 class Dict(HasTram):
 
     def __init__(self, *args, **kwargs):
-        super(Dict, self).__init__(data={})
-        if args:
-            self.data.update(args[0])
-        elif kwargs:
-            self.data.update(kwargs)
+        super(Dict, self).__init__(data=args[0] if args else kwargs)
 
     def __iter__(self):
-        return iter(self.keys())
+        """Iterate over the keys of a snapshot of the dict, which is never mutated"""
+        return iter(self.data)
 
     def __getitem__(self, key):
         try:
@@ -476,33 +1066,25 @@ class Dict(HasTram):
             raise KeyError(key)
 
     def __setitem__(self, key, item):
-        @atomic
         def fun(data):
             result = data.copy()
             result.update({key : item})
             return result
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
     def __delitem__(self, key):
-        @atomic
         def fun(data):
             result = data.copy()
             result.pop(key)
             return result
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
-    @property
-    def data(self):
-        return self._data
-
-    @data.setter
-    def data(self, item):
+    @staticmethod
+    def _coerce(item):
         if item:
-            self._data = dict(item)
+            return dict(item)
         else:
-            self._data = {}
+            return {}
 
     @classmethod
     def fromkeys(cls, iterable, value=None):
@@ -517,19 +1099,354 @@ class Dict(HasTram):
         return default
 
     def items(self):
-        return list(self.data.items())
+        """Return a view of the current items, unaffected by later writes"""
+        return self.data.items()
 
     def keys(self):
-        return list(self.data.keys())
+        """Return a view of the current keys, unaffected by later writes"""
+        return self.data.keys()
+
+    def increment(self, key, amount=1):
+        """Add amount to the value stored at key, starting from zero"""
+        def fun(data):
+            result = data.copy()
+            result[key] = result.get(key, 0) + amount
+            return result
+        self.commute(fun)
 
     def update(self, mapping):
-        @atomic
         def fun(data):
             result = data.copy()
             result.update(mapping)
             return result
-        do = Action()
-        do.transaction(self, write_action=fun)
+        Action.apply(self, fun)
 
     def values(self):
-        return list(self.data.values())
+        """Return a view of the current values, unaffected by later writes"""
+        return self.data.values()
+
+
+class Set(HasTram):
+    """Set backed by a PersistentSet, so updates share structure
+
+    Adding or discarding an item copies O(log n) trie nodes rather than
+    the whole set, and the in-place operators commit a whole batch at once.
+    """
+
+    def __init__(self, data=None):
+        super().__init__()
+        self.data = data
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, repr(set(self.data)) if self.data else '')
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __or__(self, other):
+        return self.__class__(self.data.union(self._cast(other)))
+
+    def __and__(self, other):
+        return self.__class__(self.data.intersection(self._cast(other)))
+
+    def __sub__(self, other):
+        return self.__class__(self.data.difference(self._cast(other)))
+
+    def __xor__(self, other):
+        return self.__class__(self.data.symmetric_difference(self._cast(other)))
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        other = self._cast(other)
+        Action.apply(self, lambda data: data.symmetric_difference(other))
+        return self
+
+    @staticmethod
+    def _coerce(item):
+        if isinstance(item, PersistentSet):
+            return item
+        elif item:
+            return PersistentSet(item)
+        else:
+            return PersistentSet()
+
+    def add(self, item):
+        self.commute(lambda data: data.add(item))
+
+    def discard(self, item):
+        Action.apply(self, lambda data: data.discard(item))
+
+    def remove(self, item):
+        Action.apply(self, lambda data: data.remove(item))
+
+    def pop(self):
+        result = []
+        def fun(data):
+            try:
+                result[:] = [next(iter(data))]
+            except StopIteration:
+                raise KeyError('pop from an empty set')
+            return data.remove(result[0])
+        Action.apply(self, fun)
+        return result[0]
+
+    def isdisjoint(self, other):
+        return self.data.isdisjoint(self._cast(other))
+
+    def issubset(self, other):
+        return self.data <= set(self._cast(other))
+
+    def issuperset(self, other):
+        return all(item in self.data for item in self._cast(other))
+
+    def update(self, *others):
+        others = [self._cast(other) for other in others]
+        Action.apply(self, lambda data: data.union(*others))
+
+    def intersection_update(self, *others):
+        others = [self._cast(other) for other in others]
+        Action.apply(self, lambda data: data.intersection(*others))
+
+    def difference_update(self, *others):
+        others = [self._cast(other) for other in others]
+        Action.apply(self, lambda data: data.difference(*others))
+
+
+class SortedList(HasTram):
+    """Sorted list backed by a persistent B+ tree
+
+    add and remove are O(log n) and share structure with the previous
+    version, and bisection and range queries read one committed snapshot.
+    """
+
+    def __init__(self, data=None):
+        super().__init__()
+        self.data = data
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, repr(list(self.data)))
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __reversed__(self):
+        return reversed(self.data)
+
+    @staticmethod
+    def _coerce(item):
+        if isinstance(item, PersistentSortedList):
+            return item
+        else:
+            return PersistentSortedList(item or ())
+
+    def add(self, item):
+        self.commute(lambda data: data.add(item))
+
+    def update(self, iterable):
+        items = list(iterable)
+        Action.apply(self, lambda data: data.update(items))
+
+    def discard(self, item):
+        Action.apply(self, lambda data: data.discard(item))
+
+    def remove(self, item):
+        Action.apply(self, lambda data: data.remove(item))
+
+    def pop(self, index=-1):
+        result = []
+        def fun(data):
+            item, data = data.pop(index)
+            result[:] = [item]
+            return data
+        Action.apply(self, fun)
+        return result[0]
+
+    def bisect_left(self, item):
+        return self.data.bisect_left(item)
+
+    def bisect_right(self, item):
+        return self.data.bisect_right(item)
+
+    bisect = bisect_right
+
+    def count(self, item):
+        return self.data.count(item)
+
+    def index(self, item, *args):
+        return self.data.index(item, *args)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Iterate over items between minimum and maximum in one snapshot"""
+        return self.data.irange(minimum, maximum, inclusive)
+
+
+class SortedDict(HasTram):
+    """Mapping kept in key order, backed by a PersistentSortedMap"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.data = args[0] if args else kwargs
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, repr(dict(self.data.items())))
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __reversed__(self):
+        return reversed(self.data)
+
+    def __setitem__(self, key, item):
+        Action.apply(self, lambda data: data.set(key, item))
+
+    def __delitem__(self, key):
+        Action.apply(self, lambda data: data.delete(key))
+
+    @staticmethod
+    def _coerce(item):
+        if isinstance(item, PersistentSortedMap):
+            return item
+        else:
+            return PersistentSortedMap(item or ())
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def items(self):
+        return self.data.items()
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def update(self, mapping):
+        Action.apply(self, lambda data: data.update(mapping))
+
+    def bisect_left(self, key):
+        return self.data.bisect_left(key)
+
+    def bisect_right(self, key):
+        return self.data.bisect_right(key)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Iterate over keys between minimum and maximum in one snapshot"""
+        return self.data.irange(minimum, maximum, inclusive)
+
+    def peekitem(self, index=-1):
+        return self.data.peekitem(index)
+
+    def popitem(self, index=-1):
+        result = []
+        def fun(data):
+            result[:] = [data.peekitem(index)]
+            return data.delete(result[0][0])
+        Action.apply(self, fun)
+        return result[0]
+
+
+class Notifier:
+    """Change feed subscriber which wakes threads waiting on its condition"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+
+    def publish(self, change):
+        with self.condition:
+            self.condition.notify_all()
+
+
+class PriorityQueue(HasTram):
+    """Min-priority queue backed by a persistent leftist heap
+
+    push and pop_min are O(log n). pop blocks until a commit adds an item,
+    waking on a change notification rather than polling.
+    """
+
+    def __init__(self, data=None):
+        super().__init__()
+        self.data = data
+        self._notifier = Notifier()
+        self._watched = False
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, repr(sorted(self.data)))
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        # copies have no subscribers, so they must attach a notifier of their own
+        del state['_notifier']
+        del state['_watched']
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._notifier = Notifier()
+        self._watched = False
+
+    @staticmethod
+    def _coerce(item):
+        if isinstance(item, PersistentHeap):
+            return item
+        else:
+            return PersistentHeap(item or ())
+
+    def peek(self):
+        return self.data.peek()
+
+    def push(self, item):
+        self.commute(lambda data: data.push(item))
+
+    def push_many(self, iterable):
+        items = list(iterable)
+        Action.apply(self, lambda data: data.push_many(items))
+
+    def pop_min(self):
+        """Remove and return the smallest item; raises IndexError if empty"""
+        result = []
+        def fun(data):
+            item, data = data.pop()
+            result[:] = [item]
+            return data
+        Action.apply(self, fun)
+        return result[0]
+
+    def pop(self, block=True, timeout=None):
+        """Remove and return the smallest item, waiting for one if needed
+
+        Raises queue.Empty if the queue is empty and block is false, or if
+        timeout seconds pass without an item arriving.
+        """
+        condition = self._notifier.condition
+        if block and not self._watched:
+            from tram.feed import attach
+            with condition:
+                if not self._watched:
+                    attach(self, self._notifier)
+                    self._watched = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            version = self.version
+            try:
+                return self.pop_min()
+            except IndexError:
+                if not block:
+                    raise queue.Empty
+            with condition:
+                while self.version == version:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise queue.Empty
+                    condition.wait(remaining)
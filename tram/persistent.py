@@ -0,0 +1,835 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Immutable collections with structure sharing
+
+PersistentMap is a hash array mapped trie: setting or deleting a key
+copies only the O(log32 n) nodes on the path to it, and every other node
+is shared with the previous version. PersistentSortedList is a B+ tree
+which does the same for sorted sequences, with subtree sizes so that
+indexing and bisection are O(log n) too. PersistentHeap is a leftist
+heap, whose push and pop rebuild only its O(log n) right spine. This makes them cheap to use as
+the committed data of tram objects, which are replaced rather than mutated.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections.abc import Mapping, Sequence, Set
+
+BITS = 5
+MASK = (1 << BITS) - 1
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def popcount(n):
+    return bin(n).count('1')
+
+
+class BitmapNode:
+    """Trie node holding up to 32 entries, indexed by a 5-bit hash slice
+
+    Entries are either (hash, key, value) tuples or child nodes.
+    """
+
+    __slots__ = ('bitmap', 'array')
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+    def replace(self, index, entry):
+        return BitmapNode(self.bitmap, self.array[ :index] + (entry, ) + self.array[index+1: ])
+
+
+class CollisionNode:
+    """Leaf holding entries whose hashes are entirely equal"""
+
+    __slots__ = ('array', )
+
+    def __init__(self, array):
+        self.array = array
+
+
+EMPTY = BitmapNode(0, ())
+
+
+def merge(shift, first, second):
+    """Return a node holding two entries with different keys"""
+    if shift >= HASH_BITS:
+        return CollisionNode((first, second))
+    first_bits = (first[0] >> shift) & MASK
+    second_bits = (second[0] >> shift) & MASK
+    if first_bits == second_bits:
+        return BitmapNode(1 << first_bits, (merge(shift + BITS, first, second), ))
+    if first_bits > second_bits:
+        first, second = second, first
+    return BitmapNode((1 << first_bits) | (1 << second_bits), (first, second))
+
+
+def lookup(node, key, h, default):
+    shift = 0
+    while True:
+        if type(node) is CollisionNode:
+            for __, other, value in node.array:
+                if other is key or other == key:
+                    return value
+            return default
+        bit = 1 << ((h >> shift) & MASK)
+        if not node.bitmap & bit:
+            return default
+        entry = node.array[popcount(node.bitmap & (bit - 1))]
+        if type(entry) is tuple:
+            if entry[1] is key or entry[1] == key:
+                return entry[2]
+            return default
+        node = entry
+        shift += BITS
+
+
+def assoc(node, shift, entry):
+    """Return (node with entry set, whether a key was added)"""
+    h, key, value = entry
+    if type(node) is CollisionNode:
+        for index, other in enumerate(node.array):
+            if other[1] is key or other[1] == key:
+                if other[2] is value:
+                    return node, False
+                return CollisionNode(node.array[ :index] + (entry, ) + node.array[index+1: ]), False
+        return CollisionNode(node.array + (entry, )), True
+    bit = 1 << ((h >> shift) & MASK)
+    index = popcount(node.bitmap & (bit - 1))
+    if not node.bitmap & bit:
+        return BitmapNode(node.bitmap | bit, node.array[ :index] + (entry, ) + node.array[index: ]), True
+    other = node.array[index]
+    if type(other) is tuple:
+        if other[1] is key or other[1] == key:
+            if other[2] is value:
+                return node, False
+            return node.replace(index, entry), False
+        return node.replace(index, merge(shift + BITS, other, entry)), True
+    child, added = assoc(other, shift + BITS, entry)
+    if child is other:
+        return node, False
+    return node.replace(index, child), added
+
+
+def dissoc(node, shift, key, h):
+    """Return node without key, or the same node if key is absent"""
+    if type(node) is CollisionNode:
+        array = tuple(entry for entry in node.array if not (entry[1] is key or entry[1] == key))
+        if len(array) == len(node.array):
+            return node
+        if len(array) == 1:
+            return array[0]
+        return CollisionNode(array)
+    bit = 1 << ((h >> shift) & MASK)
+    if not node.bitmap & bit:
+        return node
+    index = popcount(node.bitmap & (bit - 1))
+    other = node.array[index]
+    if type(other) is tuple:
+        if not (other[1] is key or other[1] == key):
+            return node
+        child = None
+    else:
+        child = dissoc(other, shift + BITS, key, h)
+        if child is other:
+            return node
+        # pull lone entries up, so that removing keys shrinks the trie
+        if type(child) is BitmapNode and len(child.array) == 1 and type(child.array[0]) is tuple:
+            child = child.array[0]
+    if child is None:
+        array = node.array[ :index] + node.array[index+1: ]
+        if shift and len(array) == 1 and type(array[0]) is tuple:
+            return array[0]
+        return BitmapNode(node.bitmap & ~bit, array)
+    return node.replace(index, child)
+
+
+def entries(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for entry in node.array:
+            if type(entry) is tuple:
+                yield entry
+            else:
+                stack.append(entry)
+
+
+def make_entry(key, value):
+    return (hash(key) & HASH_MASK, key, value)
+
+
+class PersistentMap(Mapping):
+    """Immutable mapping; set, delete and update return new maps"""
+
+    __slots__ = ('_root', '_len')
+
+    def __init__(self, items=()):
+        self._root = EMPTY
+        self._len = 0
+        if items:
+            result = self.update(items)
+            self._root, self._len = result._root, result._len
+
+    @classmethod
+    def _make(cls, root, length):
+        result = cls.__new__(cls)
+        result._root = root
+        result._len = length
+        return result
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self.items()), ))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, dict(self.items()))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for __, key, __ in entries(self._root):
+            yield key
+
+    def __getitem__(self, key):
+        result = lookup(self._root, key, hash(key) & HASH_MASK, _missing)
+        if result is _missing:
+            raise KeyError(key)
+        return result
+
+    def __contains__(self, key):
+        return lookup(self._root, key, hash(key) & HASH_MASK, _missing) is not _missing
+
+    def get(self, key, default=None):
+        return lookup(self._root, key, hash(key) & HASH_MASK, default)
+
+    def items(self):
+        return ItemsView(self)
+
+    def values(self):
+        return ValuesView(self)
+
+    def set(self, key, value):
+        root, added = assoc(self._root, 0, make_entry(key, value))
+        if root is self._root:
+            return self
+        return self._make(root, self._len + added)
+
+    def delete(self, key):
+        """Return a map without key; raises KeyError if it is missing"""
+        root = dissoc(self._root, 0, key, hash(key) & HASH_MASK)
+        if root is self._root:
+            raise KeyError(key)
+        return self._make(root, self._len - 1)
+
+    def discard(self, key):
+        """Return a map without key, which may already be missing"""
+        root = dissoc(self._root, 0, key, hash(key) & HASH_MASK)
+        if root is self._root:
+            return self
+        return self._make(root, self._len - 1)
+
+    def update(self, items=(), **kwargs):
+        """Return a map with every key-value pair from items and kwargs set"""
+        if isinstance(items, Mapping):
+            items = items.items()
+        root, length = self._root, self._len
+        for pairs in (items, kwargs.items()):
+            for key, value in pairs:
+                root, added = assoc(root, 0, make_entry(key, value))
+                length += added
+        if root is self._root:
+            return self
+        return self._make(root, length)
+
+
+class ItemsView:
+    """Iterable, sized view of a map's items which walks the trie directly"""
+
+    __slots__ = ('_map', )
+
+    def __init__(self, mapping):
+        self._map = mapping
+
+    def __len__(self):
+        return len(self._map)
+
+    def __iter__(self):
+        for __, key, value in entries(self._map._root):
+            yield key, value
+
+    def __contains__(self, item):
+        key, value = item
+        found = self._map.get(key, _missing)
+        return found is value or found == value
+
+
+class ValuesView(ItemsView):
+
+    __slots__ = ()
+
+    def __iter__(self):
+        for __, __, value in entries(self._map._root):
+            yield value
+
+    def __contains__(self, value):
+        return any(other is value or other == value for other in self)
+
+
+class SortedItemsView(ItemsView):
+
+    __slots__ = ()
+
+    def __iter__(self):
+        mapping = self._map._map
+        for key in self._map._keys:
+            yield key, mapping[key]
+
+
+class SortedValuesView(ValuesView):
+
+    __slots__ = ()
+
+    def __iter__(self):
+        mapping = self._map._map
+        for key in self._map._keys:
+            yield mapping[key]
+
+
+class PersistentSet(Set):
+    """Immutable set; add, discard and the set algebra return new sets"""
+
+    __slots__ = ('_map', )
+
+    def __init__(self, items=()):
+        self._map = PersistentMap().update((item, True) for item in items)
+
+    @classmethod
+    def _make(cls, mapping):
+        result = cls.__new__(cls)
+        result._map = mapping
+        return result
+
+    @classmethod
+    def _from_iterable(cls, iterable):
+        return cls(iterable)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self), ))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, set(self))
+
+    def __len__(self):
+        return len(self._map)
+
+    def __iter__(self):
+        return iter(self._map)
+
+    def __contains__(self, item):
+        return item in self._map
+
+    def _with(self, mapping):
+        return self if mapping is self._map else self._make(mapping)
+
+    def add(self, item):
+        return self._with(self._map.set(item, True))
+
+    def discard(self, item):
+        return self._with(self._map.discard(item))
+
+    def remove(self, item):
+        """Return a set without item; raises KeyError if it is missing"""
+        return self._make(self._map.delete(item))
+
+    def union(self, *others):
+        mapping = self._map
+        for other in others:
+            mapping = mapping.update((item, True) for item in other)
+        return self._with(mapping)
+
+    def intersection(self, *others):
+        result = self
+        for other in others:
+            if not isinstance(other, (Set, set, frozenset)):
+                other = set(other)
+            if len(other) < len(result) // 2:
+                result = self._make(PersistentMap().update(
+                    (item, True) for item in other if item in result
+                ))
+            else:
+                mapping = result._map
+                for item in result:
+                    if item not in other:
+                        mapping = mapping.delete(item)
+                result = result._with(mapping)
+        return result
+
+    def difference(self, *others):
+        mapping = self._map
+        for other in others:
+            for item in other:
+                mapping = mapping.discard(item)
+        return self._with(mapping)
+
+    def symmetric_difference(self, other):
+        mapping = self._map
+        for item in set(other):
+            if item in mapping:
+                mapping = mapping.delete(item)
+            else:
+                mapping = mapping.set(item, True)
+        return self._with(mapping)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    __xor__ = symmetric_difference
+
+
+LEAF_SIZE = 64
+BRANCH_SIZE = 32
+
+
+class Leaf:
+    """B+ tree leaf holding a sorted tuple of items"""
+
+    __slots__ = ('items', )
+
+    def __init__(self, items):
+        self.items = items
+
+    @property
+    def size(self):
+        return len(self.items)
+
+    @property
+    def width(self):
+        return len(self.items)
+
+    @property
+    def maximum(self):
+        return self.items[-1]
+
+
+class Branch:
+    """B+ tree node holding children with their maxima and sizes"""
+
+    __slots__ = ('children', 'maxes', 'sizes', 'size')
+
+    def __init__(self, children):
+        self.children = children
+        self.maxes = tuple(child.maximum for child in children)
+        self.sizes = tuple(child.size for child in children)
+        self.size = sum(self.sizes)
+
+    @property
+    def width(self):
+        return len(self.children)
+
+    @property
+    def maximum(self):
+        return self.maxes[-1]
+
+
+EMPTY_LEAF = Leaf(())
+
+
+def split(node_type, members, limit):
+    """Return one node of members, or two if there are more than limit"""
+    if len(members) <= limit:
+        return (node_type(members), )
+    half = len(members) // 2
+    return (node_type(members[ :half]), node_type(members[half: ]))
+
+
+def insort(node, item):
+    """Return a tuple of one or two nodes: node with item inserted"""
+    if type(node) is Leaf:
+        items = node.items
+        index = bisect_right(items, item)
+        return split(Leaf, items[ :index] + (item, ) + items[index: ], LEAF_SIZE)
+    index = min(bisect_right(node.maxes, item), len(node.children) - 1)
+    children = node.children
+    children = children[ :index] + insort(children[index], item) + children[index+1: ]
+    return split(Branch, children, BRANCH_SIZE)
+
+
+def join(left, right):
+    """Merge two neighbouring nodes of the same depth, splitting if too big"""
+    if type(left) is Leaf:
+        return split(Leaf, left.items + right.items, LEAF_SIZE)
+    return split(Branch, left.children + right.children, BRANCH_SIZE)
+
+
+def rebalance(children, index):
+    """Merge children[index] into a neighbour if it has become too narrow"""
+    child = children[index]
+    limit = LEAF_SIZE if type(child) is Leaf else BRANCH_SIZE
+    if child.width >= limit // 4 or len(children) == 1:
+        return children
+    if index + 1 < len(children):
+        return children[ :index] + join(child, children[index+1]) + children[index+2: ]
+    return children[ :index-1] + join(children[index-1], child) + children[index+1: ]
+
+
+def remove_item(node, item):
+    """Return node without one occurrence of item, or None if it is empty
+
+    Raises ValueError if item is absent.
+    """
+    if type(node) is Leaf:
+        items = node.items
+        index = bisect_left(items, item)
+        if index == len(items) or items[index] != item:
+            raise ValueError("{!r} not in list".format(item))
+        items = items[ :index] + items[index+1: ]
+        return Leaf(items) if items else None
+    index = bisect_left(node.maxes, item)
+    if index == len(node.children):
+        raise ValueError("{!r} not in list".format(item))
+    child = remove_item(node.children[index], item)
+    children = node.children
+    if child is None:
+        children = children[ :index] + children[index+1: ]
+    else:
+        children = rebalance(children[ :index] + (child, ) + children[index+1: ], index)
+    return Branch(children) if children else None
+
+
+def build(items):
+    """Build a tree from an already sorted tuple of items"""
+    if not items:
+        return EMPTY_LEAF
+    step = LEAF_SIZE // 2
+    nodes = [Leaf(items[start:start + step]) for start in range(0, len(items), step)]
+    step = BRANCH_SIZE // 2
+    while len(nodes) > 1:
+        nodes = [Branch(tuple(nodes[start:start + step])) for start in range(0, len(nodes), step)]
+    return nodes[0]
+
+
+def locate(node, index):
+    """Return (leaf, offset) holding the item at a non-negative index"""
+    while type(node) is Branch:
+        for child, size in zip(node.children, node.sizes):
+            if index < size:
+                node = child
+                break
+            index -= size
+    return node, index
+
+
+def rank(node, item, bisect):
+    """Count items before the insertion point of item, per bisect"""
+    result = 0
+    while type(node) is Branch:
+        index = bisect(node.maxes, item)
+        if index == len(node.children):
+            return result + node.size
+        result += sum(node.sizes[ :index])
+        node = node.children[index]
+    return result + bisect(node.items, item)
+
+
+def walk(node, start, stop):
+    """Yield items with start <= index < stop"""
+    if start >= stop:
+        return
+    if type(node) is Leaf:
+        yield from node.items[start:stop]
+        return
+    for child, size in zip(node.children, node.sizes):
+        if start < size:
+            yield from walk(child, max(start, 0), min(stop, size))
+        start -= size
+        stop -= size
+        if stop <= 0:
+            return
+
+
+class PersistentSortedList(Sequence):
+    """Immutable sorted sequence; add, remove and update return new lists"""
+
+    __slots__ = ('_root', )
+
+    def __init__(self, items=()):
+        self._root = build(tuple(sorted(items)))
+
+    @classmethod
+    def _make(cls, root):
+        result = cls.__new__(cls)
+        result._root = root if root is not None else EMPTY_LEAF
+        return result
+
+    def __reduce__(self):
+        return (self.__class__, (list(self), ))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, list(self))
+
+    def __len__(self):
+        return self._root.size
+
+    def __iter__(self):
+        return walk(self._root, 0, self._root.size)
+
+    def __reversed__(self):
+        for index in range(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(walk(self._root, *self._span(index)))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("list index out of range")
+        leaf, offset = locate(self._root, index)
+        return leaf.items[offset]
+
+    def __contains__(self, item):
+        index = self.bisect_left(item)
+        return index < len(self) and self[index] == item
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def _span(self, index):
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("slices of sorted lists must have step 1")
+        return start, stop
+
+    def bisect_left(self, item):
+        return rank(self._root, item, bisect_left)
+
+    def bisect_right(self, item):
+        return rank(self._root, item, bisect_right)
+
+    bisect = bisect_right
+
+    def count(self, item):
+        return self.bisect_right(item) - self.bisect_left(item)
+
+    def index(self, item, start=0, stop=None):
+        index = max(self.bisect_left(item), start)
+        if index < len(self) and (stop is None or index < stop) and self[index] == item:
+            return index
+        raise ValueError("{!r} is not in list".format(item))
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Iterate over items between minimum and maximum, in order"""
+        start, stop = 0, len(self)
+        if minimum is not None:
+            start = (self.bisect_left if inclusive[0] else self.bisect_right)(minimum)
+        if maximum is not None:
+            stop = (self.bisect_right if inclusive[1] else self.bisect_left)(maximum)
+        return walk(self._root, start, stop)
+
+    def add(self, item):
+        nodes = insort(self._root, item)
+        return self._make(nodes[0] if len(nodes) == 1 else Branch(nodes))
+
+    def update(self, items):
+        """Return a list with all items added, rebuilding if that is cheaper"""
+        items = list(items)
+        if len(items) * 8 > len(self):
+            return self._make(build(tuple(sorted(list(self) + items))))
+        result = self
+        for item in items:
+            result = result.add(item)
+        return result
+
+    def remove(self, item):
+        """Return a list without one occurrence of item; raises ValueError if missing"""
+        root = remove_item(self._root, item)
+        while type(root) is Branch and len(root.children) == 1:
+            root = root.children[0]
+        return self._make(root)
+
+    def discard(self, item):
+        try:
+            return self.remove(item)
+        except ValueError:
+            return self
+
+    def pop(self, index=-1):
+        """Return the item at index and a list without it"""
+        item = self[index]
+        return item, self.remove(item)
+
+
+class PersistentSortedMap(Mapping):
+    """Immutable mapping which iterates in key order
+
+    Keys are kept in a PersistentSortedList and values in a PersistentMap.
+    """
+
+    __slots__ = ('_keys', '_map')
+
+    def __init__(self, items=()):
+        self._map = PersistentMap(items)
+        self._keys = PersistentSortedList(self._map)
+
+    @classmethod
+    def _make(cls, keys, mapping):
+        result = cls.__new__(cls)
+        result._keys = keys
+        result._map = mapping
+        return result
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self.items()), ))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, dict(self.items()))
+
+    def __len__(self):
+        return len(self._map)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __reversed__(self):
+        return reversed(self._keys)
+
+    def __getitem__(self, key):
+        return self._map[key]
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def get(self, key, default=None):
+        return self._map.get(key, default)
+
+    def keys(self):
+        return self._keys
+
+    def items(self):
+        return SortedItemsView(self)
+
+    def values(self):
+        return SortedValuesView(self)
+
+    def set(self, key, value):
+        keys = self._keys if key in self._map else self._keys.add(key)
+        return self._make(keys, self._map.set(key, value))
+
+    def delete(self, key):
+        """Return a map without key; raises KeyError if it is missing"""
+        mapping = self._map.delete(key)
+        return self._make(self._keys.remove(key), mapping)
+
+    def update(self, items=(), **kwargs):
+        if isinstance(items, Mapping):
+            items = items.items()
+        items = list(items)
+        items.extend(kwargs.items())
+        mapping = self._map.update(items)
+        if len(mapping) == len(self._map):
+            return self._make(self._keys, mapping)
+        # only the incoming keys can be new, so don't walk the whole map
+        added = dict.fromkeys(key for key, __ in items if key not in self._map)
+        return self._make(self._keys.update(added), mapping)
+
+    def irange(self, minimum=None, maximum=None, inclusive=(True, True)):
+        """Iterate over keys between minimum and maximum, in order"""
+        return self._keys.irange(minimum, maximum, inclusive)
+
+    def bisect_left(self, key):
+        return self._keys.bisect_left(key)
+
+    def bisect_right(self, key):
+        return self._keys.bisect_right(key)
+
+    def peekitem(self, index=-1):
+        key = self._keys[index]
+        return key, self._map[key]
+
+
+def meld(left, right):
+    """Merge two leftist heaps of (rank, item, left, right) tuples"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if right[1] < left[1]:
+        left, right = right, left
+    __, item, child, spine = left
+    spine = meld(spine, right)
+    if child is None or child[0] < spine[0]:
+        child, spine = spine, child
+    return (spine[0] + 1 if spine is not None else 1, item, child, spine)
+
+
+class PersistentHeap:
+    """Immutable min-heap; push and pop return new heaps"""
+
+    __slots__ = ('_root', '_len')
+
+    def __init__(self, items=()):
+        self._root = None
+        self._len = 0
+        if items:
+            result = self.push_many(items)
+            self._root, self._len = result._root, result._len
+
+    @classmethod
+    def _make(cls, root, length):
+        result = cls.__new__(cls)
+        result._root = root
+        result._len = length
+        return result
+
+    def __reduce__(self):
+        return (self.__class__, (list(self), ))
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, sorted(self))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        """Iterate over items in no particular order"""
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            __, item, left, right = stack.pop()
+            yield item
+            stack.extend(node for node in (left, right) if node is not None)
+
+    def peek(self):
+        if self._root is None:
+            raise IndexError("peek at an empty heap")
+        return self._root[1]
+
+    def push(self, item):
+        return self._make(meld(self._root, (1, item, None, None)), self._len + 1)
+
+    def push_many(self, items):
+        """Return a heap with all items added, melding them pairwise in O(k)"""
+        heaps = [(1, item, None, None) for item in items]
+        if not heaps:
+            return self
+        count = len(heaps)
+        while len(heaps) > 1:
+            heaps = [meld(*heaps[start:start + 2]) if start + 1 < len(heaps) else heaps[start]
+                     for start in range(0, len(heaps), 2)]
+        return self._make(meld(self._root, heaps[0]), self._len + count)
+
+    def pop(self):
+        """Return the smallest item and a heap without it"""
+        if self._root is None:
+            raise IndexError("pop from an empty heap")
+        __, item, left, right = self._root
+        return item, self._make(meld(left, right), self._len - 1)
+
+
+_missing = object()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Record transaction workloads and replay them reproducibly
+
+A Recorder installed while a real workload runs notes, for every
+transaction, which thread ran it, when it started, which instances it
+read and wrote, how long its write action took and how many attempts it
+needed. replay() runs the same shape of workload against fresh objects,
+either on free-running threads or under a Scheduler.
+
+A Scheduler lets only one of its threads run at a time and hands control
+from one to another only at the scheduling points of Action.pause --
+before each read, lock, validate and commit -- choosing with a seeded
+random generator. Given the same workload and seed, every run interleaves
+the same way and ends with the same aborts, so contention managers, lock
+strategies and object types can be compared on equal terms.
+
+    with Recorder() as recorder:
+        run_workload()
+    recorder.save('workload.json')
+
+    steps = load('workload.json')
+    replay(steps, scheduler=Scheduler(seed=1))
+
+Hooks which wait for other threads, like a Journal with group fsync,
+can't run under a Scheduler.
+"""
+
+from collections import namedtuple
+import json
+import random
+import threading
+import time
+
+from tram.objects import Action, Int
+
+POINTS = ('read', 'lock', 'validate', 'commit')
+
+Step = namedtuple('Step', 'thread start reads writes duration attempts'.split())
+Result = namedtuple('Result', 'commits attempts aborts elapsed schedule'.split())
+
+
+class Recording:
+    """Trace of one transaction, kept by Recorder as it runs"""
+
+    __slots__ = ('recorder', 'start', 'attempts', 'phase', 'write_started', 'duration')
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.start = time.perf_counter()
+        self.attempts = 0
+        self.phase = None
+        self.write_started = None
+        self.duration = 0.0
+
+    def begin(self, phase):
+        now = time.perf_counter()
+        if self.phase is None:
+            self.attempts += 1
+        if self.phase == 'write':
+            self.duration = now - self.write_started
+        if phase == 'write':
+            self.write_started = now
+        self.phase = phase
+
+    def end(self, action, outcome):
+        self.phase = None
+        if outcome == 'commit':
+            self.recorder.add(self, action)
+
+
+class Recorder:
+    """Collects a Step for each transaction committed while installed
+
+    Uses the Action.tracer slot, so it can't run alongside a Tracer.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self._started = time.perf_counter()
+        self._threads = {} # thread : index, keeping thread objects alive
+        self._instances = {} # id : (index, instance), keeping ids from being reused
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def install(self):
+        self._started = time.perf_counter()
+        Action.tracer = self
+
+    def uninstall(self):
+        if Action.tracer is self:
+            Action.tracer = None
+
+    def start(self):
+        return Recording(self)
+
+    def add(self, recording, action):
+        reads = {id(record.instance) : record.instance for record in action.read_log}
+        writes = {id(record.instance) : record.instance for record in action.write_log}
+        with self._lock:
+            thread = self._threads.setdefault(threading.current_thread(), len(self._threads))
+            self.steps.append(Step(
+                thread,
+                recording.start - self._started,
+                sorted(self._index(instance) for instance in reads.values()),
+                sorted(self._index(instance) for instance in writes.values()),
+                recording.duration,
+                recording.attempts,
+            ))
+
+    def _index(self, instance):
+        index, __ = self._instances.setdefault(id(instance), (len(self._instances), instance))
+        return index
+
+    def save(self, path):
+        save(self.steps, path)
+
+
+def save(steps, path):
+    """Write steps to path as JSON"""
+    with open(path, 'w') as fileobj:
+        json.dump([list(step) for step in steps], fileobj)
+
+
+def load(path):
+    """Read steps written by save"""
+    with open(path) as fileobj:
+        return [Step(*fields) for fields in json.load(fileobj)]
+
+
+class Scheduler:
+    """Runs functions on threads one at a time, switching at scheduling points
+
+    At each of the given points, the running thread hands over to a thread
+    picked at random, itself included, with the given probability. A
+    thread which finds an instance locked always hands over to another.
+    The threads picked are appended to `schedule`.
+    """
+
+    def __init__(self, seed=0, points=POINTS, probability=0.5):
+        self.points = frozenset(points)
+        self.probability = probability
+        self.schedule = []
+        self._random = random.Random(seed)
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._runnable = []
+        self._turn = None
+        self._order = {} # id : position in the locking order
+        self._seen = [] # keeps ids in _order from being reused
+
+    def run(self, functions):
+        """Call each function on its own thread, interleaved by this scheduler
+
+        Raises the first exception raised by any of the functions.
+        """
+        errors = []
+        def worker(index, function):
+            self._local.index = index
+            with self._condition:
+                while self._turn != index:
+                    self._condition.wait()
+            try:
+                function()
+            except BaseException as error:
+                errors.append(error)
+            finally:
+                with self._condition:
+                    self._runnable.remove(index)
+                    if self._runnable:
+                        self._pick(self._runnable)
+                    self._condition.notify_all()
+        functions = list(functions)
+        self._runnable = list(range(len(functions)))
+        thread_list = [
+            threading.Thread(target=worker, args=(index, function))
+            for index, function in enumerate(functions)
+        ]
+        Action.scheduler = self
+        try:
+            for thread in thread_list:
+                thread.start()
+            with self._condition:
+                if self._runnable:
+                    self._pick(self._runnable)
+                self._condition.notify_all()
+            for thread in thread_list:
+                thread.join()
+        finally:
+            Action.scheduler = None
+        if errors:
+            raise errors[0]
+
+    def pause(self, action, point):
+        if point in self.points and self._managed():
+            if self._random.random() < self.probability:
+                self.switch()
+
+    def lock(self, instance_list):
+        """Lock instances, running other threads while any is held elsewhere
+
+        Instances are locked in the order the scheduler first saw them,
+        rather than by id, so that replays don't depend on memory layout.
+        """
+        if not self._managed():
+            for instance in sorted(instance_list, key=id):
+                instance.__enter__()
+            return
+        with self._condition:
+            order = []
+            for instance in instance_list:
+                if id(instance) not in self._order:
+                    self._order[id(instance)] = len(self._order)
+                    self._seen.append(instance)
+                order.append(self._order[id(instance)])
+        for __, instance in sorted(zip(order, instance_list), key=lambda pair: pair[0]):
+            while not instance._lock.acquire(blocking=False):
+                self.switch(others=True)
+
+    def switch(self, others=False):
+        """Hand over to a runnable thread, other than this one if others"""
+        index = self._local.index
+        with self._condition:
+            choices = [other for other in self._runnable if not others or other != index]
+            if not choices:
+                return
+            self._pick(choices)
+            self._condition.notify_all()
+            while self._turn != index:
+                self._condition.wait()
+
+    def _managed(self):
+        return getattr(self._local, 'index', None) is not None
+
+    def _pick(self, choices):
+        self._turn = self._random.choice(choices)
+        self.schedule.append(self._turn)
+
+
+def replay(steps, scheduler=None, factory=Int, action=Action, retries=100, time_scale=0.0):
+    """Run the transactions of steps against fresh objects
+
+    Each recorded instance is replaced with factory(), and each step with
+    a transaction of the given Action class over the instances it read and
+    wrote, which adds one to each instance it wrote. Steps run in order on
+    one thread per recorded thread. Without a scheduler, threads start
+    each step at its recorded time and spend its recorded duration in the
+    write action, both multiplied by time_scale; with one, time is ignored.
+    Returns a Result counting commits, attempts and aborts.
+    """
+    steps = list(steps)
+    count = 1 + max((index for step in steps for index in step.reads + step.writes), default=-1)
+    instances = [factory() for _ in range(count)]
+    threads = {}
+    for step in sorted(steps, key=lambda step: step.start):
+        threads.setdefault(step.thread, []).append(step)
+    attempts = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def run(step):
+        written = [instances[index] for index in step.writes]
+        def read_action(instance_list):
+            with lock:
+                attempts.append(1)
+            return do.read(instance_list)
+        def write_action(instance_list, read_list):
+            if scheduler is None and step.duration and time_scale:
+                time.sleep(step.duration * time_scale)
+            for instance, data in zip(instance_list, read_list):
+                if any(instance is other for other in written):
+                    yield instance, data + 1
+        do = action(retries=retries)
+        involved = sorted(set(step.reads) | set(step.writes))
+        do.transaction(
+            *(instances[index] for index in involved),
+            write_action=write_action, read_action=read_action,
+        )
+
+    def worker(thread_steps):
+        for step in thread_steps:
+            if scheduler is None and time_scale:
+                delay = started + step.start * time_scale - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            run(step)
+
+    functions = [lambda thread_steps=thread_steps: worker(thread_steps)
+                 for thread_steps in threads.values()]
+    if scheduler is not None:
+        scheduler.run(functions)
+    else:
+        thread_list = [threading.Thread(target=function) for function in functions]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+    return Result(
+        len(steps),
+        len(attempts),
+        len(attempts) - len(steps),
+        time.perf_counter() - started,
+        list(scheduler.schedule) if scheduler is not None else None,
+    )
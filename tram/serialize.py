@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Binary snapshots of tram object graphs
+
+dump() reads every tram object reachable from a value inside a single
+read-only transaction, so the snapshot is consistent even while other
+threads commit, and writes it in a compact tagged format. Lists of plain
+ints or floats are written as packed arrays straight from a memoryview,
+and loaded back with array.frombytes rather than element by element.
+"""
+
+from array import array
+import io
+import pickle
+import struct
+import sys
+
+from tram.objects import (CLOCK, Action, Dict, Float, HasTram, Int, List, PriorityQueue, Set,
+                          SortedDict, SortedList, ValidationError)
+from tram.persistent import (PersistentHeap, PersistentSet, PersistentSortedList,
+                             PersistentSortedMap)
+
+MAGIC = b'TRAM\x01'
+
+OBJECT_TAGS = {
+    Dict : b'D', Float : b'F', Int : b'I', List : b'L', Set : b'S',
+    SortedDict : b'M', SortedList : b'O', PriorityQueue : b'Q',
+}
+OBJECT_TYPES = {tag : cls for cls, tag in OBJECT_TAGS.items()}
+
+COUNT = struct.Struct('<I')
+INT = struct.Struct('<q')
+FLOAT = struct.Struct('<d')
+
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class FormatError(Exception):
+    """Raised when a snapshot can't be decoded"""
+    pass
+
+
+def plain(value):
+    """Convert persistent collections to the builtins they are written as"""
+    kind = type(value)
+    if kind in (PersistentHeap, PersistentSet, PersistentSortedList):
+        return list(value)
+    if kind is PersistentSortedMap:
+        return dict(value.items())
+    return value
+
+
+def children(value):
+    """Yield tram instances directly referenced by a plain value"""
+    stack = [value]
+    while stack:
+        value = plain(stack.pop())
+        if isinstance(value, HasTram):
+            yield value
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+
+
+def snapshot(root, retries=100):
+    """Consistently read every instance reachable from root
+
+    Returns a list of (instance, data, version) in discovery order. This
+    is a read-only TL2 pass: every read is checked against the lock and the
+    version the pass started at, so nothing needs to be locked to validate
+    it, and writers are never held up.
+    """
+    do = Action(retries=retries)
+    while True:
+        with do:
+            try:
+                seen = {}
+                pending = list(children(root))
+                while pending:
+                    instance = pending.pop()
+                    if id(instance) in seen:
+                        continue
+                    seen[id(instance)] = instance
+                    data, = do.read([instance])
+                    pending.extend(children(data))
+                return [tuple(record) for record in do.read_log]
+            except ValidationError:
+                do.wait_blocked()
+        do.decrement_retries()
+
+
+class Encoder:
+
+    def __init__(self, index):
+        self.index = index
+        self.chunks = []
+
+    def emit(self, tag, *chunks):
+        self.chunks.append(tag)
+        self.chunks.extend(chunks)
+
+    def value(self, value):
+        value = plain(value)
+        kind = type(value)
+        if value is None:
+            self.emit(b'N')
+        elif value is True:
+            self.emit(b'T')
+        elif value is False:
+            self.emit(b'f')
+        elif kind is int:
+            if INT_MIN <= value <= INT_MAX:
+                self.emit(b'i', INT.pack(value))
+            else:
+                blob = value.to_bytes((value.bit_length() + 8) // 8, 'little', signed=True)
+                self.emit(b'j', COUNT.pack(len(blob)), blob)
+        elif kind is float:
+            self.emit(b'd', FLOAT.pack(value))
+        elif kind is str:
+            blob = value.encode('utf-8')
+            self.emit(b's', COUNT.pack(len(blob)), blob)
+        elif kind is bytes:
+            self.emit(b'b', COUNT.pack(len(value)), value)
+        elif kind is list:
+            self.sequence(value)
+        elif kind is tuple:
+            self.emit(b't', COUNT.pack(len(value)))
+            for item in value:
+                self.value(item)
+        elif kind is dict:
+            self.emit(b'm', COUNT.pack(len(value)))
+            for key, item in value.items():
+                self.value(key)
+                self.value(item)
+        elif isinstance(value, HasTram):
+            self.emit(b'r', COUNT.pack(self.index[id(value)]))
+        else:
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self.emit(b'p', COUNT.pack(len(blob)), blob)
+
+    def sequence(self, value):
+        kinds = set(map(type, value))
+        if kinds == {int}:
+            try:
+                self.packed(b'q', array('q', value))
+                return
+            except OverflowError:
+                pass
+        elif kinds == {float}:
+            self.packed(b'g', array('d', value))
+            return
+        self.emit(b'l', COUNT.pack(len(value)))
+        for item in value:
+            self.value(item)
+
+    def packed(self, tag, values):
+        if sys.byteorder == 'big':
+            values.byteswap()
+        self.emit(tag, COUNT.pack(len(values)), memoryview(values).cast('B'))
+
+
+class Decoder:
+
+    def __init__(self, buffer, instances):
+        self.buffer = buffer
+        self.instances = instances
+        self.offset = 0
+
+    def take(self, size):
+        start = self.offset
+        self.offset += size
+        if self.offset > len(self.buffer):
+            raise FormatError("snapshot is truncated")
+        return self.buffer[start:self.offset]
+
+    def unpack(self, codec):
+        value, = codec.unpack_from(self.buffer, self.offset)
+        self.offset += codec.size
+        return value
+
+    def count(self):
+        return self.unpack(COUNT)
+
+    def value(self):
+        tag = bytes(self.take(1))
+        if tag == b'N':
+            return None
+        elif tag == b'T':
+            return True
+        elif tag == b'f':
+            return False
+        elif tag == b'i':
+            return self.unpack(INT)
+        elif tag == b'j':
+            return int.from_bytes(self.take(self.count()), 'little', signed=True)
+        elif tag == b'd':
+            return self.unpack(FLOAT)
+        elif tag == b's':
+            return str(self.take(self.count()), 'utf-8')
+        elif tag == b'b':
+            return bytes(self.take(self.count()))
+        elif tag == b'l':
+            return [self.value() for _ in range(self.count())]
+        elif tag == b't':
+            return tuple(self.value() for _ in range(self.count()))
+        elif tag == b'm':
+            result = {}
+            for _ in range(self.count()):
+                key = self.value()
+                result[key] = self.value()
+            return result
+        elif tag == b'r':
+            return self.instances[self.count()]
+        elif tag in (b'q', b'g'):
+            values = array('q' if tag == b'q' else 'd')
+            values.frombytes(self.take(self.count() * values.itemsize))
+            if sys.byteorder == 'big':
+                values.byteswap()
+            return values.tolist()
+        elif tag == b'p':
+            return pickle.loads(self.take(self.count()))
+        raise FormatError("unknown tag {!r} at offset {}".format(tag, self.offset - 1))
+
+
+def dump(value, fileobj):
+    """Write a consistent snapshot of value and the tram objects it references"""
+    records = snapshot(value)
+    index = {id(instance) : n for n, (instance, __, __) in enumerate(records)}
+    encoder = Encoder(index)
+    encoder.emit(MAGIC, COUNT.pack(len(records)))
+    for instance, __, __ in records:
+        try:
+            encoder.chunks.append(OBJECT_TAGS[type(instance)])
+        except KeyError:
+            raise TypeError("can't serialize instances of type {}".format(type(instance).__name__))
+    for __, data, version in records:
+        encoder.chunks.append(FLOAT.pack(version))
+        encoder.value(data)
+    encoder.value(value)
+    fileobj.writelines(encoder.chunks)
+
+
+def dumps(value):
+    """Return a consistent snapshot of value as bytes"""
+    fileobj = io.BytesIO()
+    dump(value, fileobj)
+    return fileobj.getvalue()
+
+
+def load(fileobj):
+    """Read a snapshot written by dump"""
+    return loads(fileobj.read())
+
+
+def loads(buffer):
+    """Rebuild a value and its tram objects from a snapshot"""
+    buffer = memoryview(buffer)
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise FormatError("not a tram snapshot")
+    decoder = Decoder(buffer, [])
+    decoder.offset = len(MAGIC)
+    for tag in bytes(decoder.take(decoder.count())):
+        try:
+            decoder.instances.append(OBJECT_TYPES[bytes([tag])]())
+        except KeyError:
+            raise FormatError("unknown object tag {!r}".format(bytes([tag])))
+    for instance in decoder.instances:
+        version = decoder.unpack(FLOAT)
+        CLOCK.advance(version)
+        instance.publish(decoder.value(), version)
+    return decoder.value()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Share named tram objects between processes over a socket
+
+A Server hosts tram objects under names, on a Unix socket path or a
+(host, port) pair, and serves each connection on its own thread. Clients
+send batches of operations as one message and get all their results back
+in one reply. Client.transaction runs a write function locally against a
+consistent snapshot and sends its writes along with the versions it read,
+which the server checks optimistically, so each attempt costs one round
+trip to read and one to commit.
+
+Messages are pickled, so only share a server with processes you trust.
+An authkey is required for anything but a Unix socket, and clients may
+only call the data methods listed in CALLABLE.
+"""
+
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client as connect, Listener, address_type
+import queue
+import threading
+
+from tram.objects import Action, HasTram, MaxRetryError, Record, ValidationError
+
+# methods which clients may call; anything else could bypass locking,
+# like publish, or never return, like subscribe
+CALLABLE = frozenset((
+    '__contains__', '__delitem__', '__getitem__', '__iadd__', '__imul__', '__isub__',
+    '__itruediv__', '__ifloordiv__', '__ior__', '__iand__', '__len__', '__setitem__',
+    'add', 'append', 'bisect_left', 'bisect_right', 'clear', 'count', 'difference_update',
+    'discard', 'extend', 'get', 'increment', 'index', 'insert', 'intersection_update',
+    'irange', 'isdisjoint', 'issubset', 'issuperset', 'items', 'keys', 'peek', 'peekitem',
+    'pop', 'pop_min', 'popitem', 'push', 'push_many', 'remove', 'reverse', 'sort', 'update',
+    'values',
+))
+
+
+class ConflictError(Exception):
+    """Raised when a remote commit read versions which are no longer current"""
+    pass
+
+
+class RemoteError(Exception):
+    """Raised when the server could not run an operation"""
+    pass
+
+
+class Server:
+    """Host named tram objects for Clients"""
+
+    def __init__(self, address, objects=None, authkey=None, family=None):
+        if authkey is None and (family or address_type(address)) != 'AF_UNIX':
+            raise ValueError("an authkey is required for anything but a Unix socket")
+        self.objects = dict(objects or {})
+        self._listener = Listener(address, family=family, authkey=authkey)
+        self._authkey = authkey
+        self._thread = None
+        self._closed = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def register(self, name, instance):
+        self.objects[name] = instance
+
+    def start(self):
+        """Accept connections on a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (AuthenticationError, OSError, EOFError):
+                # a client failed to connect or authenticate; keep serving others
+                continue
+            if self._closed:
+                connection.close()
+                return
+            threading.Thread(target=self.handle, args=(connection, ), daemon=True).start()
+
+    def close(self):
+        self._closed = True
+        if self._thread is not None:
+            # closing the listener doesn't interrupt accept, so connect to it
+            try:
+                connect(self.address, address_type(self.address), self._authkey).close()
+            except OSError:
+                pass
+            self._thread.join()
+            self._thread = None
+        self._listener.close()
+
+    def handle(self, connection):
+        """Answer batches of operations until the client disconnects"""
+        with connection:
+            while True:
+                try:
+                    batch = connection.recv()
+                except (EOFError, OSError):
+                    return
+                replies = []
+                for operation in batch:
+                    try:
+                        replies.append(('ok', self.dispatch(*operation)))
+                    except Exception as error:
+                        replies.append(('error', error))
+                connection.send(replies)
+
+    def dispatch(self, operation, *args):
+        try:
+            handler = getattr(self, 'do_' + operation)
+        except AttributeError:
+            raise RemoteError("unknown operation {!r}".format(operation))
+        return handler(*args)
+
+    def lookup(self, names):
+        try:
+            return [self.objects[name] for name in names]
+        except KeyError as error:
+            raise RemoteError("no object named {!r}".format(error.args[0]))
+
+    def do_names(self):
+        return sorted(self.objects)
+
+    def do_read(self, names):
+        """Return {name : (data, version)} from one consistent snapshot"""
+        instance_list = self.lookup(names)
+        result = {}
+        def fun(instance_list, read_list):
+            result.clear()
+            for name, record in zip(names, do.read_log):
+                result[name] = (record.value, record.version)
+            return ()
+        do = Action()
+        do.transaction(*instance_list, write_action=fun)
+        return result
+
+    def do_commit(self, reads, writes):
+        """Commit writes if every version in reads is still current
+
+        reads maps names to the versions the client saw, and writes maps
+        names to new data. Raises ConflictError otherwise.
+        """
+        names = list(dict.fromkeys(list(reads) + list(writes)))
+        instance_list = self.lookup(names)
+        by_name = dict(zip(names, instance_list))
+        def read_action(instance_list):
+            for name, version in reads.items():
+                instance = by_name[name]
+                if instance.version > version:
+                    raise ValidationError("Read log is stale")
+                do.read_log.append(Record(instance, None, version))
+            return []
+        def fun(instance_list, read_list):
+            for name, value in writes.items():
+                yield by_name[name], value
+        do = Action(retries=1)
+        try:
+            do.transaction(*instance_list, write_action=fun, read_action=read_action)
+        except MaxRetryError:
+            raise ConflictError("versions read by the client are stale")
+        return {name : by_name[name].version for name in writes}
+
+    def do_call(self, name, method, args, kwargs):
+        """Call a method of a hosted object; returns None if it returns the object"""
+        if method not in CALLABLE:
+            raise RemoteError("can't call {!r} remotely".format(method))
+        instance, = self.lookup([name])
+        result = getattr(instance, method)(*args, **kwargs)
+        if isinstance(result, HasTram):
+            return None
+        if method in ('items', 'keys', 'values') or hasattr(result, '__next__'):
+            return list(result)
+        return result
+
+
+class Pipeline:
+    """Batch of operations sent to the server in a single message"""
+
+    def __init__(self, client):
+        self.client = client
+        self.operations = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def read(self, *names):
+        self.operations.append(('read', names))
+        return self
+
+    def call(self, name, method, *args, **kwargs):
+        self.operations.append(('call', name, method, args, kwargs))
+        return self
+
+    def execute(self):
+        """Send every queued operation and return their results in order"""
+        operations, self.operations = self.operations, []
+        return self.client.request(operations)
+
+
+class Proxy:
+    """Stand-in for one object hosted by a Server"""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __repr__(self):
+        return "{}({!r})".format(self.__class__.__name__, self.name)
+
+    def get(self):
+        return self.client.read(self.name)[self.name]
+
+    def call(self, method, *args, **kwargs):
+        return self.client.call(self.name, method, *args, **kwargs)
+
+    def transaction(self, function, retries=100):
+        """Replace data with function(data), retrying on conflict"""
+        return self.client.transaction([self.name], function, retries=retries)
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        def remote(*args, **kwargs):
+            return self.call(method, *args, **kwargs)
+        return remote
+
+    def __getitem__(self, key):
+        return self.call('__getitem__', key)
+
+    def __setitem__(self, key, value):
+        self.call('__setitem__', key, value)
+
+    def __delitem__(self, key):
+        self.call('__delitem__', key)
+
+    def __contains__(self, key):
+        return self.call('__contains__', key)
+
+    def __len__(self):
+        return self.call('__len__')
+
+    def __iadd__(self, other):
+        self.call('__iadd__', other)
+        return self
+
+    def __isub__(self, other):
+        self.call('__isub__', other)
+        return self
+
+
+class Client:
+    """Connection pool to a Server"""
+
+    def __init__(self, address, authkey=None, family=None, pool_size=4):
+        self.address = address
+        self.authkey = authkey
+        self.family = family
+        self._pool = queue.LifoQueue(pool_size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, name):
+        return Proxy(self, name)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def request(self, operations):
+        """Send a batch of operations in one round trip; return their results"""
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = connect(self.address, family=self.family, authkey=self.authkey)
+        try:
+            connection.send(list(operations))
+            replies = connection.recv()
+        except Exception:
+            connection.close()
+            raise
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+        results = []
+        for status, value in replies:
+            if status == 'error':
+                raise value
+            results.append(value)
+        return results
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def names(self):
+        return self.request([('names', )])[0]
+
+    def read(self, *names):
+        """Return {name : data} from one consistent snapshot"""
+        snapshot, = self.request([('read', names)])
+        return {name : data for name, (data, __) in snapshot.items()}
+
+    def call(self, name, method, *args, **kwargs):
+        return self.request([('call', name, method, args, kwargs)])[0]
+
+    def transaction(self, names, function, retries=100):
+        """Run function(*data) locally and commit the values it returns
+
+        function receives the data of each named object, from one snapshot,
+        and returns an iterable of new data in the same order. The commit
+        fails if any of the objects changed in the meantime, in which case
+        the whole transaction is retried.
+        """
+        for _ in range(retries):
+            snapshot, = self.request([('read', names)])
+            values = list(function(*(snapshot[name][0] for name in names)))
+            reads = {name : snapshot[name][1] for name in names}
+            writes = dict(zip(names, values))
+            try:
+                self.request([('commit', reads, writes)])
+                return values
+            except ConflictError:
+                continue
+        raise MaxRetryError
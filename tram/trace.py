@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+"""Timelines of individual transactions
+
+A Tracer installed on Action records, for each attempt of a sampled
+transaction, one span per phase -- read, write, lock, validate and
+commit -- and one span for the whole attempt, tagged with its outcome and
+the sizes of its logs. Spans go to a bounded ring buffer per thread, so a
+tracer left running keeps only the most recent ones, and can be exported
+as Chrome trace-event JSON for chrome://tracing or Perfetto.
+
+    with Tracer(sample_rate=0.01) as tracer:
+        run_workload()
+    tracer.save('trace.json')
+"""
+
+from collections import deque
+import json
+import os
+import random
+import threading
+import time
+
+from tram.objects import Action
+
+
+class Trace:
+    """Phases of the attempts of one transaction, as they happen"""
+
+    __slots__ = ('buffer', 'attempt', 'started', 'phase', 'phase_started')
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.attempt = 0
+        self.started = None
+        self.phase = None
+        self.phase_started = None
+
+    def begin(self, phase):
+        """End the current phase, if any, and start the next"""
+        now = time.perf_counter_ns()
+        if self.phase is None:
+            self.attempt += 1
+            self.started = now
+        else:
+            self.buffer.append((self.phase, self.phase_started, now, None))
+        self.phase = phase
+        self.phase_started = now
+
+    def end(self, action, outcome):
+        """End the current attempt of action with outcome"""
+        now = time.perf_counter_ns()
+        if self.phase is None:
+            return
+        self.buffer.append((self.phase, self.phase_started, now, None))
+        self.buffer.append(('attempt', self.started, now, {
+            'attempt' : self.attempt,
+            'outcome' : outcome,
+            'instances' : len(action.instance_list),
+            'reads' : len(action.read_log),
+            'writes' : len(action.write_log),
+        }))
+        self.phase = None
+
+
+class Tracer:
+    """Opt-in recorder of transaction phases
+
+    sample_rate is the fraction of transactions traced, and buffer_size the
+    number of spans each thread keeps.
+    """
+
+    def __init__(self, sample_rate=1.0, buffer_size=65536):
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self._local = threading.local()
+        self._buffers = [] # (thread id, thread name, buffer)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    def install(self):
+        """Start tracing transactions on every thread"""
+        Action.tracer = self
+
+    def uninstall(self):
+        if Action.tracer is self:
+            Action.tracer = None
+
+    def start(self):
+        """Return a Trace for a new transaction, or None if it isn't sampled"""
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = deque(maxlen=self.buffer_size)
+            thread = threading.current_thread()
+            with self._lock:
+                self._buffers.append((thread.ident, thread.name, buffer))
+        return Trace(buffer)
+
+    def clear(self):
+        with self._lock:
+            for __, __, buffer in self._buffers:
+                buffer.clear()
+
+    def events(self):
+        """Return recorded spans as trace-event dicts, in order of starting"""
+        pid = os.getpid()
+        result = []
+        with self._lock:
+            buffers = list(self._buffers)
+        for tid, name, buffer in buffers:
+            result.append({
+                'name' : 'thread_name', 'ph' : 'M', 'pid' : pid, 'tid' : tid,
+                'args' : {'name' : name},
+            })
+            for phase, start, stop, args in buffer.copy():
+                event = {
+                    'name' : phase, 'cat' : 'tram', 'ph' : 'X', 'pid' : pid, 'tid' : tid,
+                    'ts' : start / 1000, 'dur' : (stop - start) / 1000,
+                }
+                if args is not None:
+                    event['args'] = args
+                result.append(event)
+        # attempts before the phases they contain, phases in the order logged
+        result.sort(key=lambda event: (event.get('ts', 0), event['name'] != 'attempt'))
+        return result
+
+    def dump(self, fileobj):
+        """Write recorded spans to fileobj as trace-event JSON"""
+        json.dump({'traceEvents' : self.events(), 'displayTimeUnit' : 'ms'}, fileobj)
+
+    def save(self, path):
+        with open(path, 'w') as fileobj:
+            self.dump(fileobj)